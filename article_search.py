@@ -0,0 +1,156 @@
+import html
+from sqlalchemy import bindparam, text
+from models import db
+
+# External-content FTS5 table indexing the article store's headline and content (SQLite)
+ARTICLE_SEARCH_TABLE = 'articles_fts'
+
+# Expression index backing the same search on PostgreSQL
+ARTICLE_SEARCH_INDEX = 'ix_articles_search'
+ARTICLE_SEARCH_DOCUMENT = "to_tsvector('english', coalesce(headline, '') || ' ' || coalesce(content, ''))"
+
+# Hits returned by default, and at most
+DEFAULT_SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 500
+
+# Words of content around the matches in a snippet
+SNIPPET_WORDS = 24
+
+# bm25 weights of the headline and content columns; a match in the headline counts more
+HEADLINE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+# Control characters marking matches in snippets until the snippet has been HTML-escaped
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+# Triggers keeping the FTS5 table in step with articles, however rows are written
+SQLITE_SEARCH_DDL = (
+    f"""CREATE VIRTUAL TABLE {ARTICLE_SEARCH_TABLE} USING fts5(
+        headline, content, content='articles', content_rowid='id',
+        tokenize='porter unicode61')""",
+    f"""CREATE TRIGGER IF NOT EXISTS articles_fts_insert AFTER INSERT ON articles BEGIN
+        INSERT INTO {ARTICLE_SEARCH_TABLE}(rowid, headline, content)
+        VALUES (new.id, new.headline, new.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS articles_fts_delete AFTER DELETE ON articles BEGIN
+        INSERT INTO {ARTICLE_SEARCH_TABLE}({ARTICLE_SEARCH_TABLE}, rowid, headline, content)
+        VALUES ('delete', old.id, old.headline, old.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS articles_fts_update
+        AFTER UPDATE OF headline, content ON articles BEGIN
+        INSERT INTO {ARTICLE_SEARCH_TABLE}({ARTICLE_SEARCH_TABLE}, rowid, headline, content)
+        VALUES ('delete', old.id, old.headline, old.content);
+        INSERT INTO {ARTICLE_SEARCH_TABLE}(rowid, headline, content)
+        VALUES (new.id, new.headline, new.content);
+    END""",
+    # Index the articles stored before the search table existed
+    f"INSERT INTO {ARTICLE_SEARCH_TABLE}({ARTICLE_SEARCH_TABLE}) VALUES ('rebuild')",
+)
+
+def ensure_article_search_index(database):
+    """Create the full-text index over Factiva articles if the database doesn't have it yet.
+
+    On SQLite this is an FTS5 table kept in sync by triggers on articles, on
+    PostgreSQL a GIN index over the articles' tsvector.
+
+    Returns:
+        bool: True if the index was created.
+    """
+    dialect = database.engine.dialect.name
+    with database.engine.begin() as conn:
+        if dialect == 'sqlite':
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                  {'name': ARTICLE_SEARCH_TABLE}).first()
+            if exists:
+                return False
+            for statement in SQLITE_SEARCH_DDL:
+                conn.execute(text(statement))
+        elif dialect == 'postgresql':
+            if database.inspect(conn).has_index('articles', ARTICLE_SEARCH_INDEX):
+                return False
+            conn.execute(text(f"CREATE INDEX {ARTICLE_SEARCH_INDEX} ON articles "
+                              f"USING GIN ({ARTICLE_SEARCH_DOCUMENT})"))
+        else:
+            return False
+    print(f"Created the Factiva article search index ({dialect}).")
+    return True
+
+def fts_query(query):
+    """Turn free text into an FTS5 query matching every word, so user input is never FTS5 syntax."""
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+def highlight_snippet(snippet):
+    """HTML-escape a snippet and wrap its matches, marked by MATCH_START/MATCH_END, in <mark>."""
+    return (html.escape(snippet or '')
+            .replace(MATCH_START, '<mark>')
+            .replace(MATCH_END, '</mark>'))
+
+def search_articles(query, table_id=None, start=None, end=None, limit=DEFAULT_SEARCH_LIMIT):
+    """Full-text search of Factiva article headlines and content, best matches first.
+
+    Args:
+        query: Words to search for; articles must contain all of them (stemmed).
+        table_id: Only return articles linked to this ReturnsTable.
+        start: Only return articles published on or after this datetime.
+        end: Only return articles published before this datetime.
+        limit: Maximum number of hits.
+
+    Returns:
+        list: Dicts with the article's id, headline, author, publish_date, source, an HTML
+            snippet of its content with the matches in <mark>, and rank
+            (lower is better on SQLite, higher on PostgreSQL).
+    """
+    filters = []
+    params = {'limit': limit}
+    if table_id is not None:
+        filters.append("a.id IN (SELECT article_id FROM returns_table_articles "
+                       "WHERE returns_table_id = :table_id)")
+        params['table_id'] = table_id
+    if start is not None:
+        filters.append("a.publish_date >= :start")
+        params['start'] = start
+    if end is not None:
+        filters.append("a.publish_date < :end")
+        params['end'] = end
+    where = ''.join(f" AND {condition}" for condition in filters)
+
+    if db.engine.dialect.name == 'postgresql':
+        params['query'] = query
+        statement = text(f"""
+            SELECT a.id, a.headline, a.author, a.publish_date, a.source,
+                   ts_headline('english', coalesce(a.content, ''), q,
+                               'StartSel={MATCH_START}, StopSel={MATCH_END}, MaxWords={SNIPPET_WORDS}') AS snippet,
+                   ts_rank({ARTICLE_SEARCH_DOCUMENT}, q) AS rank
+            FROM articles a, plainto_tsquery('english', :query) q
+            WHERE {ARTICLE_SEARCH_DOCUMENT} @@ q{where}
+            ORDER BY rank DESC
+            LIMIT :limit""")
+    else:
+        params['query'] = fts_query(query)
+        statement = text(f"""
+            SELECT a.id, a.headline, a.author, a.publish_date, a.source,
+                   snippet({ARTICLE_SEARCH_TABLE}, 1, '{MATCH_START}', '{MATCH_END}', '...', {SNIPPET_WORDS}) AS snippet,
+                   bm25({ARTICLE_SEARCH_TABLE}, {HEADLINE_WEIGHT}, {CONTENT_WEIGHT}) AS rank
+            FROM {ARTICLE_SEARCH_TABLE}
+            JOIN articles a ON a.id = {ARTICLE_SEARCH_TABLE}.rowid
+            WHERE {ARTICLE_SEARCH_TABLE} MATCH :query{where}
+            ORDER BY rank
+            LIMIT :limit""")
+
+    # Bind the dates through the DateTime type so they compare like the stored values
+    if start is not None:
+        statement = statement.bindparams(bindparam('start', type_=db.DateTime))
+    if end is not None:
+        statement = statement.bindparams(bindparam('end', type_=db.DateTime))
+    statement = statement.columns(publish_date=db.DateTime)
+
+    return [{
+        'id': row.id,
+        'headline': row.headline,
+        'author': row.author,
+        'publish_date': row.publish_date.isoformat() if row.publish_date else None,
+        'source': row.source,
+        'snippet': highlight_snippet(row.snippet),
+        'rank': row.rank
+    } for row in db.session.execute(statement, params)]
@@ -0,0 +1,89 @@
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+
+# Pragmas applied to every new SQLite connection.
+# WAL lets readers keep reading the last committed data while a write transaction
+# (e.g. a long upload or merge) is open; synchronous=NORMAL is safe under WAL and
+# avoids an fsync per commit. Negative cache_size is in KiB.
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -64000),
+    ('mmap_size', 268435456),
+    ('busy_timeout', 30000),
+    ('foreign_keys', 'ON'),
+)
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Connect event listener setting SQLITE_PRAGMAS on a new DB-API connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+def configure_sqlite_engine(engine):
+    """Apply SQLITE_PRAGMAS to every connection the engine opens; other dialects are left alone.
+
+    Must be called before the engine hands out its first connection.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    event.listen(engine, 'connect', apply_sqlite_pragmas)
+    print(f"SQLite pragmas enabled: {', '.join(f'{name}={value}' for name, value in SQLITE_PRAGMAS)}")
+
+class WriteQueue:
+    """First-come, first-served queue letting one write transaction run at a time.
+
+    SQLite allows a single writer per database. Rather than letting concurrent writers
+    race for the lock and fail with "database is locked", each one waits for its turn
+    here; readers never enter the queue. A thread already holding its turn can re-enter.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._next_ticket = 0
+        self._now_serving = 0
+        self._owner = None
+        self._depth = 0
+
+    def acquire(self):
+        with self._condition:
+            if self._owner == threading.get_ident():
+                self._depth += 1
+                return
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while ticket != self._now_serving or self._owner is not None:
+                self._condition.wait()
+            self._owner = threading.get_ident()
+            self._depth = 1
+
+    def release(self):
+        with self._condition:
+            self._depth -= 1
+            if self._depth:
+                return
+            self._owner = None
+            self._now_serving += 1
+            self._condition.notify_all()
+
+write_queue = WriteQueue()
+
+@contextmanager
+def serialized_write():
+    """Hold the process-wide write turn for the duration of the block.
+
+    Wrap everything from the first write of a transaction up to its commit or rollback:
+
+        with serialized_write():
+            ...
+            db.session.commit()
+    """
+    write_queue.acquire()
+    try:
+        yield
+    finally:
+        write_queue.release()
@@ -0,0 +1,200 @@
+"""Print SQLite's EXPLAIN QUERY PLAN for every statement the routes issue.
+
+Each route is called against a throwaway copy of the database, the SQL it runs is
+captured, and the plan of each statement is printed. Statements with a WHERE clause
+that still scan a whole table are flagged, as are routes issuing more queries than
+their QUERY_BUDGETS entry allows (an N+1 pattern coming back); the exit status is 1
+if anything is flagged.
+
+Usage:
+    python explain_queries.py [path/to/returns.db] [table_id]
+"""
+import os
+import shutil
+import sys
+import tempfile
+from sqlalchemy import event
+from main import create_app
+from models import db, ReturnsTable, Column, DateCell
+from table_store import CELL_MODELS
+from ingest import count_table_rows
+from utils import RENDER_BATCH_ROWS
+
+DEFAULT_DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'returns.db')
+
+# Maximum number of queries a route may issue, whatever the size of the table.
+# get_table: the table's version, then on a render cache miss the table with its columns,
+# one query per cell kind for each RENDER_BATCH_ROWS rows (the budget covers one batch;
+# see query_budgets) and the version again before caching.
+# get_table_rows: the table, the row counts and the page's row positions, then one query per cell kind.
+QUERY_BUDGETS = {
+    'get_table': 3 + len(CELL_MODELS),
+    'get_table_shell': 3,
+    'get_table_rows': 4 + len(CELL_MODELS),
+    'get_table_columns': 2 + len(CELL_MODELS),
+    'search_factiva_articles': 1,
+}
+
+def build_app(database_path):
+    # create_app brings older databases up to date (row positions, the article store and
+    # its search index) the way the app does on startup, so the routes can run on them
+    return create_app(f'sqlite:///{database_path}')
+
+def route_requests(table_id):
+    """Return the (label, method, url, json) requests that exercise each route for one table."""
+    column = Column.query.filter_by(returns_table_id=table_id).order_by(Column.id).first()
+    date_cell = (db.session.query(DateCell.id)
+                 .filter(DateCell.column_id == column.id)
+                 .first()) if column else None
+    requests = [
+        ("index", "GET", "/", None),
+        ("get_table", "GET", f"/get_table/{table_id}", None),
+        ("get_table_shell", "GET", f"/get_table/{table_id}?server_side=1", None),
+        ("get_table_rows", "GET", f"/get_table_rows/{table_id}?draw=1&start=10&length=25"
+                                  "&order[0][column]=0&order[0][dir]=desc&search[value]=1", None),
+        ("get_columns", "GET", f"/get_columns/{table_id}", None),
+        ("get_table_columns", "GET", f"/get_table_columns/{table_id}?dates=epoch_days", None),
+        ("get_table_changes", "GET", f"/get_table_changes/{table_id}?since=1", None),
+        ("get_factiva_articles", "GET", f"/get_factiva_articles/{table_id}", None),
+        ("get_factiva_metadata", "GET", f"/get_factiva_metadata/{table_id}", None),
+        ("search_factiva_articles", "GET", f"/search_factiva_articles?q=market&table_id={table_id}"
+                                           "&start=2000-01-01&end=2030-12-31", None),
+        ("get_footnotes", "GET", f"/get_footnotes/{table_id}", None),
+        ("chron", "GET", "/chron", None),
+        ("factiva", "GET", "/factiva", None),
+        ("save_footnote", "POST", "/save_footnote",
+         {"element_id": "returns_header_0", "footnote": "explain", "table_id": table_id}),
+        ("merge_factiva_data", "POST", "/merge_factiva_data",
+         {"table_id": table_id, "selected_columns": ["headline"]}),
+        ("link_factiva_articles", "POST", "/link_factiva_articles",
+         {"table_id": table_id, "source_table_id": table_id}),
+    ]
+    if column:
+        requests.append(("get_column", "GET", f"/get_column/{column.id}", None))
+    if date_cell:
+        requests.append(("update_datecell_acd", "POST", "/update_datecell_acd",
+                         {"cell_id": date_cell.id, "acd": 0}))
+    return requests
+
+def capture_route_statements(app, requests):
+    """Call each route and collect the distinct SQL statements (with parameters) it runs.
+
+    Returns:
+        tuple: (statements, query_counts) - label -> list of distinct (statement, parameters),
+            and label -> total number of statements executed.
+    """
+    statements = {}
+    query_counts = {}
+    current = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'INSERT INTO')):
+            current.append((statement, parameters))
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        client = app.test_client()
+        for label, method, url, payload in requests:
+            current.clear()
+            # Buffer the response so streamed bodies run their queries here
+            client.open(url, method=method, json=payload, buffered=True)
+            query_counts[label] = len(current)
+            seen = set()
+            statements[label] = []
+            for statement, parameters in current:
+                if statement not in seen:
+                    seen.add(statement)
+                    statements[label].append((statement, parameters))
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements, query_counts
+
+def query_budgets(returns_table):
+    """Return QUERY_BUDGETS for one table, allowing get_table a cell query per kind per row batch."""
+    budgets = dict(QUERY_BUDGETS)
+    if returns_table.storage != 'blob':
+        batches = max(1, -(-count_table_rows(returns_table) // RENDER_BATCH_ROWS))
+        budgets['get_table'] += len(CELL_MODELS) * (batches - 1)
+    return budgets
+
+def check_query_budgets(query_counts, budgets):
+    """Print each route's query count and return the number of routes over their budget."""
+    over_budget = 0
+    print("\n=== query counts ===")
+    for label, count in query_counts.items():
+        budget = budgets.get(label)
+        marker = ""
+        if budget is not None and count > budget:
+            marker = f"   <-- OVER BUDGET ({budget})"
+            over_budget += 1
+        print(f"    {label}: {count}{marker}")
+    return over_budget
+
+def is_full_scan(detail):
+    """True if a plan line reads a whole table instead of searching an index.
+
+    Scans of materialized subqueries (anon_N, (subquery-N)) read an already filtered result,
+    and a virtual table scan with an index (e.g. an FTS5 MATCH) only reads the matches.
+    """
+    return (detail.startswith('SCAN ')
+            and 'VIRTUAL TABLE INDEX' not in detail
+            and not detail.startswith(('SCAN anon_', 'SCAN (subquery'))
+            and 'USING INDEX' not in detail
+            and 'USING COVERING INDEX' not in detail
+            and 'USING INTEGER PRIMARY KEY' not in detail
+            and not detail.startswith('SCAN CONSTANT ROW'))
+
+def explain_statements(app, statements):
+    """Print the plan of every captured statement and return the number of flagged scans."""
+    flagged = 0
+    with app.app_context():
+        raw = db.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            for label, route_statements in statements.items():
+                print(f"\n=== {label} ({len(route_statements)} statements) ===")
+                for statement, parameters in route_statements:
+                    if statement.lstrip().upper().startswith('INSERT INTO') and 'SELECT' not in statement.upper():
+                        continue
+                    print(f"\n{' '.join(statement.split())}")
+                    cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                    filtered = ' WHERE ' in f" {' '.join(statement.upper().split())} "
+                    for _, _, _, detail in cursor.fetchall():
+                        marker = ""
+                        if filtered and is_full_scan(detail):
+                            marker = "   <-- FULL SCAN"
+                            flagged += 1
+                        print(f"    {detail}{marker}")
+        finally:
+            raw.close()
+    return flagged
+
+def main(argv):
+    database_path = argv[1] if len(argv) > 1 else DEFAULT_DATABASE
+    with tempfile.TemporaryDirectory() as workdir:
+        # Work on a copy: the write routes commit their changes
+        copy_path = os.path.join(workdir, 'returns.db')
+        shutil.copyfile(database_path, copy_path)
+        app = build_app(copy_path)
+
+        with app.app_context():
+            if len(argv) > 2:
+                table_id = int(argv[2])
+            else:
+                first_table = ReturnsTable.query.order_by(ReturnsTable.id).first()
+                if first_table is None:
+                    print("No returns tables in the database to explain.")
+                    return 0
+                table_id = first_table.id
+            requests = route_requests(table_id)
+            budgets = query_budgets(db.session.get(ReturnsTable, table_id))
+
+        statements, query_counts = capture_route_statements(app, requests)
+        flagged = explain_statements(app, statements)
+        over_budget = check_query_budgets(query_counts, budgets)
+        print(f"\n{flagged} full table scan(s) in filtered queries, {over_budget} route(s) over their query budget")
+        return 1 if flagged or over_budget else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,637 @@
+import hashlib
+import io
+import time
+from datetime import datetime
+import openpyxl
+import pandas as pd
+from sqlalchemy import and_, case, func, insert, literal, select, text
+from sqlalchemy import table as table_clause
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import object_session
+from models import ReturnsTable, Column, ColumnBlob, DateColumn, TextColumn, BaseCell, NumberCell, DateCell, TextCell, FactivaArticle, ReturnsTableArticle
+from table_store import store_column_blob
+
+# Number of cells sent to the database in each executemany batch
+CELL_BATCH_SIZE = 5000
+
+# Advisory lock key serializing base_cells id reservations across PostgreSQL sessions
+CELL_ID_LOCK_KEY = 0x63656c6c
+
+# Session-local PostgreSQL table Factiva articles are copied into before being inserted
+FACTIVA_STAGING_TABLE = 'factiva_articles_upload'
+
+# Number of CSV rows read and written at a time when streaming an upload
+CSV_CHUNK_SIZE = 50000
+
+# Number of worksheet rows read and written at a time when streaming an Excel upload
+EXCEL_CHUNK_SIZE = 10000
+
+# Number of leading rows inspected when inferring a column's type
+TYPE_SAMPLE_ROWS = 1000
+
+# Strings treated as missing in streamed Excel sheets (pandas' defaults)
+EXCEL_NA_STRINGS = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+    '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+}
+
+# Bytes read at a time when fingerprinting an upload
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Column model used for each inferred cell kind
+COLUMN_CLASSES = {
+    'date': DateColumn,
+    'number': Column,
+    'text': TextColumn,
+}
+
+# Cell kind -> (child model, polymorphic identity stored in base_cells.discriminator)
+CELL_TYPES = {
+    'date': (DateCell, 'date_cell'),
+    'number': (NumberCell, 'number_cell'),
+    'text': (TextCell, 'text_cell'),
+}
+
+def infer_column_kind(column_data, sample_size=TYPE_SAMPLE_ROWS):
+    """Return the cell kind ('date', 'number' or 'text') used to store a DataFrame column.
+
+    Besides the column dtype, the first `sample_size` non-missing values are inspected,
+    so object columns holding only datetimes are still stored as dates. A column with no
+    values at all is a number column, as pandas reads an empty CSV column; text found in
+    later chunks widens it (see widen_column_to_text).
+
+    Args:
+        column_data: pandas Series holding the column values.
+        sample_size: Number of leading values inspected.
+
+    Returns:
+        str: One of the keys of CELL_TYPES.
+    """
+    if pd.api.types.is_datetime64_any_dtype(column_data):
+        return 'date'
+    if pd.api.types.is_numeric_dtype(column_data):
+        return 'number'
+    sample = column_data.dropna().head(sample_size)
+    if not len(sample):
+        return 'number'
+    if all(isinstance(value, datetime) for value in sample):
+        return 'date'
+    return 'text'
+
+def convert_column_values(column_data, kind):
+    """Convert a whole DataFrame column into the Python values stored in the cell table.
+
+    Missing dates and numbers become None; missing text becomes "N/A", matching the
+    values the per-cell ORM path used to write.
+    """
+    if kind == 'date':
+        dates = pd.to_datetime(column_data, errors='coerce')
+        return [value.to_pydatetime() if pd.notnull(value) else None for value in dates]
+    if kind == 'number':
+        numbers = pd.to_numeric(column_data, errors='coerce').astype(float)
+        return [None if pd.isna(value) else value for value in numbers.tolist()]
+    return ["N/A" if pd.isna(value) else str(value) for value in column_data]
+
+def count_unconverted_values(column_data, kind):
+    """Return how many present values of a DataFrame column aren't valid for `kind`.
+
+    convert_column_values stores these as missing, so a column holding any of them
+    has to be stored as text instead (see widen_column_to_text).
+    """
+    if kind == 'date':
+        converted = pd.to_datetime(column_data, errors='coerce')
+    elif kind == 'number':
+        converted = pd.to_numeric(column_data, errors='coerce')
+    else:
+        return 0
+    return int((column_data.notna() & pd.isna(converted)).sum())
+
+def widen_column_to_text(connection, column, kind):
+    """Turn a number or date column into an empty text column.
+
+    The cells written so far (none for blob-stored tables, which write columns last) are
+    deleted, so the column can be written again from the raw text of the upload. The Column
+    object is removed from the session, since its class no longer matches the row.
+
+    Returns:
+        int: Number of cells deleted.
+    """
+    connection.execute(Column.__table__.update()
+                       .where(Column.__table__.c.id == column.id)
+                       .values(discriminator=TextColumn.__mapper__.polymorphic_identity))
+    object_session(column).expunge(column)
+
+    base_table = BaseCell.__table__
+    child_table = CELL_TYPES[kind][0].__table__
+    cell_ids = select(base_table.c.id).where(base_table.c.column_id == column.id)
+    connection.execute(child_table.delete().where(child_table.c.id.in_(cell_ids)))
+    return connection.execute(base_table.delete().where(base_table.c.column_id == column.id)).rowcount
+
+def reserve_cell_ids(connection, count):
+    """Reserve a contiguous block of base_cells ids and return the first one.
+
+    base_cells and the child tables share their primary key, so the ids are assigned
+    here instead of being read back from the database after every insert. On PostgreSQL
+    the block is taken from the id sequence so later sequence-generated ids don't collide.
+    """
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {'key': CELL_ID_LOCK_KEY})
+        try:
+            sequence = connection.execute(text("SELECT pg_get_serial_sequence('base_cells', 'id')")).scalar()
+            max_id = connection.execute(select(func.max(BaseCell.id))).scalar() or 0
+            last_issued = connection.execute(
+                text("SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END FROM " + sequence)
+            ).scalar()
+            first_id = max(max_id, last_issued) + 1
+            if count:
+                connection.execute(text("SELECT setval(CAST(:sequence AS regclass), :last_id)"),
+                                   {'sequence': sequence, 'last_id': first_id + count - 1})
+            return first_id
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': CELL_ID_LOCK_KEY})
+
+    max_id = connection.execute(select(func.max(BaseCell.id))).scalar() or 0
+    return max_id + 1
+
+def copy_value(value):
+    """Format one value for PostgreSQL's COPY text format (\\N is NULL)."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return (value.replace('\\', '\\\\').replace('\t', '\\t')
+                .replace('\n', '\\n').replace('\r', '\\r'))
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return str(value)
+
+def copy_rows(connection, table, column_names, rows):
+    """Stream rows into a table with COPY ... FROM STDIN (PostgreSQL only).
+
+    Args:
+        connection: SQLAlchemy connection on a psycopg2 or psycopg engine.
+        table: Table to load.
+        column_names: Names of the columns each row provides, in order.
+        rows: Iterable of tuples of values.
+
+    Returns:
+        int: Number of rows copied.
+    """
+    buffer = io.StringIO()
+    count = 0
+    for row in rows:
+        buffer.write('\t'.join(copy_value(value) for value in row))
+        buffer.write('\n')
+        count += 1
+    buffer.seek(0)
+
+    statement = f"COPY {table.name} ({', '.join(column_names)}) FROM STDIN"
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):
+            cursor.copy_expert(statement, buffer)
+        else:
+            with cursor.copy(statement) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+    return count
+
+def insert_rows(connection, table, column_names, rows):
+    """Bulk insert rows: COPY on PostgreSQL, one executemany elsewhere.
+
+    Returns:
+        int: Number of rows inserted.
+    """
+    if connection.dialect.name == 'postgresql':
+        return copy_rows(connection, table, column_names, rows)
+    records = [dict(zip(column_names, row)) for row in rows]
+    if records:
+        connection.execute(table.insert(), records)
+    return len(records)
+
+def insert_column_cells(connection, column_id, kind, values, start_row=0, batch_size=CELL_BATCH_SIZE):
+    """Write a whole column of values in batches (COPY on PostgreSQL, executemany elsewhere).
+
+    Each value becomes one base_cells row and one row in the child table for its kind,
+    paired through an explicitly reserved id.
+
+    Args:
+        connection: SQLAlchemy connection taking part in the current transaction.
+        column_id: ID of the Column the cells belong to.
+        kind: Cell kind ('date', 'number' or 'text').
+        values: List of already converted values (see convert_column_values).
+        start_row: row_position of the first value (non-zero when appending a later chunk).
+        batch_size: Number of cells written per batch.
+
+    Returns:
+        int: Number of cells written.
+    """
+    model, discriminator = CELL_TYPES[kind]
+    base_table = BaseCell.__table__
+    child_table = model.__table__
+    first_id = reserve_cell_ids(connection, len(values))
+
+    for start in range(0, len(values), batch_size):
+        batch = values[start:start + batch_size]
+        ids = range(first_id + start, first_id + start + len(batch))
+        first_row = start_row + start
+        insert_rows(connection, base_table, ('id', 'column_id', 'row_position', 'discriminator'),
+                    [(cell_id, column_id, first_row + offset, discriminator)
+                     for offset, cell_id in enumerate(ids)])
+        if kind == 'date':
+            insert_rows(connection, child_table, ('id', 'value', 'acd'),
+                        [(cell_id, value, 0) for cell_id, value in zip(ids, batch)])
+        else:
+            insert_rows(connection, child_table, ('id', 'value'), list(zip(ids, batch)))
+
+    return len(values)
+
+def article_fingerprint(article):
+    """Return the SHA-256 hex digest identifying a parsed Factiva article across uploads.
+
+    Headline, publish date, source and content are compared ignoring case and runs of
+    whitespace, so the same article exported twice gets the same fingerprint.
+    """
+    publish_date = article['publish_date']
+    parts = (article['headline'], publish_date.date().isoformat() if publish_date else '',
+             article['source'], article['content'])
+    normalized = '\x1f'.join(' '.join((part or '').split()).casefold() for part in parts)
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+def insert_factiva_articles(connection, returns_table_id, articles):
+    """Store parsed Factiva articles (see parse_html_articles) and link them to a ReturnsTable.
+
+    An article is stored once, whichever tables it is uploaded for: articles already in the
+    store are only linked, through the unique fingerprint index rather than a lookup per
+    article. Articles the table already has, and repeats within `articles`, are skipped.
+
+    Returns:
+        list: The articles newly linked to the table, in their original order.
+    """
+    if not articles:
+        return []
+    store = FactivaArticle.__table__
+    links = ReturnsTableArticle.__table__
+    fields = ('headline', 'author', 'word_count', 'publish_date', 'source', 'content')
+    column_names = ('fingerprint',) + fields
+    fingerprints = [article_fingerprint(article) for article in articles]
+    rows = [(fingerprint,) + tuple(article[field] for field in fields)
+            for article, fingerprint in zip(articles, fingerprints)]
+
+    if connection.dialect.name == 'postgresql':
+        # COPY can't skip conflicting rows, so copy into a staging table and insert from there.
+        # Each row carries its position in `articles` so ids are assigned in upload order,
+        # which is the order articles are listed and matched to dates in.
+        columns = ', '.join(column_names)
+        connection.execute(text(f"CREATE TEMPORARY TABLE IF NOT EXISTS {FACTIVA_STAGING_TABLE} AS "
+                                f"SELECT {columns}, CAST(NULL AS integer) AS ordinal "
+                                f"FROM {store.name} WITH NO DATA"))
+        copy_rows(connection, table_clause(FACTIVA_STAGING_TABLE), column_names + ('ordinal',),
+                  (row + (ordinal,) for ordinal, row in enumerate(rows)))
+        connection.execute(text(
+            f"INSERT INTO {store.name} ({columns}) SELECT {columns} FROM ("
+            f"SELECT DISTINCT ON (fingerprint) {columns}, ordinal FROM {FACTIVA_STAGING_TABLE} "
+            f"ORDER BY fingerprint, ordinal) first_copies "
+            f"ORDER BY ordinal ON CONFLICT (fingerprint) DO NOTHING"))
+        linked = connection.execute(text(
+            f"WITH linked AS (INSERT INTO {links.name} (returns_table_id, article_id) "
+            f"SELECT :table_id, s.id FROM {store.name} s "
+            f"JOIN {FACTIVA_STAGING_TABLE} u ON u.fingerprint = s.fingerprint "
+            f"GROUP BY s.id ORDER BY min(u.ordinal) "
+            f"ON CONFLICT (returns_table_id, article_id) DO NOTHING RETURNING article_id) "
+            f"SELECT s.fingerprint FROM linked JOIN {store.name} s ON s.id = linked.article_id"),
+            {'table_id': returns_table_id}).scalars().all()
+        connection.execute(text(f"TRUNCATE {FACTIVA_STAGING_TABLE}"))
+    else:
+        connection.execute(sqlite_insert(store).on_conflict_do_nothing(index_elements=['fingerprint']),
+                           [dict(zip(column_names, row)) for row in rows])
+        article_ids = dict(connection.execute(select(store.c.fingerprint, store.c.id)
+                                              .where(store.c.fingerprint.in_(set(fingerprints)))).all())
+        linked_ids = set(connection.execute(
+            sqlite_insert(links)
+            .on_conflict_do_nothing(index_elements=['returns_table_id', 'article_id'])
+            .returning(links.c.article_id),
+            [{'returns_table_id': returns_table_id, 'article_id': article_ids[fingerprint]}
+             for fingerprint in dict.fromkeys(fingerprints)]).scalars().all())
+        linked = [fingerprint for fingerprint, article_id in article_ids.items() if article_id in linked_ids]
+
+    new_fingerprints = set(linked)
+    new_articles = []
+    for article, fingerprint in zip(articles, fingerprints):
+        if fingerprint in new_fingerprints:
+            # Only the first of several identical articles was linked
+            new_fingerprints.discard(fingerprint)
+            new_articles.append(article)
+    return new_articles
+
+def write_column_values(connection, returns_table, column_id, kind, values):
+    """Write a whole column of converted values using the table's storage backend.
+
+    Returns:
+        int: Number of values written.
+    """
+    if returns_table.storage == 'blob':
+        return store_column_blob(connection, returns_table.id, column_id, kind, values)
+    return insert_column_cells(connection, column_id, kind, values)
+
+def report_throughput(label, rows, cells, started):
+    """Print rows/sec for an ingestion step and return the measured rate."""
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    rows_per_sec = rows / elapsed
+    print(f"{label}: {rows} rows / {cells} cells in {elapsed:.2f}s "
+          f"({rows_per_sec:,.0f} rows/sec, {cells / elapsed:,.0f} cells/sec)")
+    return rows_per_sec
+
+def create_table_columns(database, returns_table, sample):
+    """Create one Column per DataFrame column, typed from the sample rows.
+
+    Returns:
+        list: (Column, kind, position) tuples in file order.
+    """
+    column_kinds = []
+    for position, column_name in enumerate(sample.columns):
+        kind = infer_column_kind(sample.iloc[:, position])
+        column = COLUMN_CLASSES[kind](name=column_name, returns_table_id=returns_table.id)
+        database.session.add(column)
+        column_kinds.append((column, kind, position))
+    returns_table.upload_columns = len(column_kinds)
+    database.session.flush()
+    return column_kinds
+
+def ingest_dataframe_chunks(database, returns_table, read_chunks, progress=None):
+    """Create the columns of a ReturnsTable and write its cells chunk by chunk.
+
+    Column types are inferred from the first chunk only; every later chunk is converted
+    to those types and written before the next one is read, so only one chunk of the
+    upload is held in memory at a time. A number or date column with a value of another
+    type in a later row (e.g. a ticker column empty for the first chunk) is widened to
+    text: its cells are dropped and the upload is read again from the start with that
+    column as raw text, writing only the rows each column doesn't hold yet. A widened
+    column therefore holds the text of the file ("1.50", "1e3"), whatever the chunk size.
+    Blob-stored tables keep the column data of each chunk and write every column once,
+    after the last chunk.
+
+    Args:
+        database: Database instance to use for storing the data.
+        returns_table: Flushed ReturnsTable the columns belong to.
+        read_chunks: Callable taking a set of column positions to read as text, without
+            type conversion, and returning an iterable of DataFrames sharing the same
+            columns (e.g. pd.read_csv(..., chunksize=n, dtype=dict.fromkeys(positions, str))).
+            It is called again from the start of the upload whenever a column is widened.
+        progress: Optional callable receiving the number of rows written so far after each chunk.
+
+    Returns:
+        int: Number of rows written.
+    """
+    text_positions = set()
+    chunks = iter(read_chunks(text_positions))
+    chunk = next(chunks, None)
+    if chunk is None:
+        return 0
+    column_kinds = create_table_columns(database, returns_table, chunk)
+
+    started = time.perf_counter()
+    connection = database.session.connection()
+    use_blobs = returns_table.storage == 'blob'
+    blob_parts = {column.id: [] for column, _, _ in column_kinds}
+    # Rows each column holds; after a re-read only the rows past these are written
+    stored_rows = {column.id: 0 for column, _, _ in column_kinds}
+    start_row = 0
+    total_rows = 0
+    total_cells = 0
+    while chunk is not None:
+        widened = False
+        for index, (column, kind, position) in enumerate(column_kinds):
+            skip = stored_rows[column.id] - start_row
+            if len(chunk) and skip >= len(chunk):
+                continue
+            column_data = chunk.iloc[max(skip, 0):, position]
+            if count_unconverted_values(column_data, kind):
+                print(f"Column {column.name} has non-{kind} values after row {start_row}; "
+                      f"storing it as text")
+                widen_column_to_text(connection, column, kind)
+                column_kinds[index] = (column, 'text', position)
+                stored_rows[column.id] = 0
+                blob_parts[column.id] = []
+                text_positions.add(position)
+                widened = True
+                continue
+            first_row = start_row + max(skip, 0)
+            if use_blobs:
+                blob_parts[column.id].append(column_data)
+            else:
+                values = convert_column_values(column_data, kind)
+                total_cells += insert_column_cells(connection, column.id, kind, values, start_row=first_row)
+            stored_rows[column.id] = start_row + len(chunk)
+
+        if widened:
+            chunks = iter(read_chunks(text_positions))
+            start_row = 0
+        else:
+            start_row += len(chunk)
+            if start_row > total_rows:
+                total_rows = start_row
+                if progress:
+                    progress(total_rows)
+        chunk = next(chunks, None)
+
+    if use_blobs:
+        for column, kind, _ in column_kinds:
+            column_data = pd.concat(blob_parts.pop(column.id), ignore_index=True)
+            values = convert_column_values(column_data, kind)
+            total_cells += store_column_blob(connection, returns_table.id, column.id, kind, values)
+
+    report_throughput(f"Ingested {returns_table.name}", total_rows, total_cells, started)
+    return total_rows
+
+def fingerprint_upload(file):
+    """Return the SHA-256 hex digest of an uploaded file's bytes.
+
+    The stream is read in blocks and rewound afterwards so it can still be parsed.
+    """
+    digest = hashlib.sha256()
+    stream = file.stream
+    stream.seek(0)
+    for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def find_table_by_hash(content_hash, name=None, storage='cells'):
+    """Return a ReturnsTable produced from an upload with this hash, if any.
+
+    A table called `name` that is still as uploaded (version 1) is preferred, then the
+    oldest table. Only tables in the `storage` backend count, so a reused or copied table
+    keeps the backend the upload asked for. Tables stored before upload_columns was
+    recorded are ignored, since their uploaded columns can't be told apart from the ones
+    merged in later.
+    """
+    return (ReturnsTable.query
+            .filter_by(content_hash=content_hash, storage=storage)
+            .filter(ReturnsTable.upload_columns.isnot(None))
+            .order_by(case((and_(ReturnsTable.name == name, ReturnsTable.version == 1), 0), else_=1),
+                      ReturnsTable.id)
+            .first())
+
+def count_table_rows(returns_table):
+    """Return the number of data rows stored for a ReturnsTable."""
+    first_column = (Column.query
+                    .filter_by(returns_table_id=returns_table.id)
+                    .order_by(Column.id)
+                    .first())
+    if first_column is None:
+        return 0
+    if returns_table.storage == 'blob':
+        return first_column.blob.length if first_column.blob else 0
+    return BaseCell.query.filter_by(column_id=first_column.id).count()
+
+def clone_returns_table(database, source, name):
+    """Copy a ReturnsTable as it was uploaded, with its cells, under a new name.
+
+    Only the columns read from the uploaded file are copied, without footnotes and with
+    every ACD flag cleared, so the copy holds what the uploaded bytes contain rather than
+    the edits made to the source since. Cells (or column blobs) are copied with
+    INSERT ... SELECT statements, one per cell table and column, so nothing is parsed or
+    loaded into Python. New cell ids are the source ids shifted by a fixed offset past the
+    current maximum id, which keeps base_cells and the child tables paired.
+
+    Args:
+        database: Database instance to use for storing the data.
+        source: ReturnsTable to copy.
+        name: Name of the new table.
+
+    Returns:
+        ReturnsTable: The flushed copy.
+    """
+    returns_table = ReturnsTable(name=name, content_hash=source.content_hash, storage=source.storage,
+                                 upload_columns=source.upload_columns)
+    database.session.add(returns_table)
+    database.session.flush()
+
+    column_pairs = []
+    for column in sorted(source.columns, key=lambda c: c.id)[:source.upload_columns]:
+        new_column = column.__class__(name=column.name, returns_table_id=returns_table.id)
+        database.session.add(new_column)
+        column_pairs.append((column.id, new_column))
+    database.session.flush()
+
+    connection = database.session.connection()
+    if source.storage == 'blob':
+        blob_table = ColumnBlob.__table__
+        for old_column_id, new_column in column_pairs:
+            names = [c.name for c in blob_table.c]
+            connection.execute(insert(blob_table).from_select(names, select(*[
+                literal(new_column.id).label('column_id') if c.name == 'column_id'
+                else literal(returns_table.id).label('returns_table_id') if c.name == 'returns_table_id'
+                # No ACD flags, i.e. all 0 (see decode_acd)
+                else literal(None, c.type).label('acd') if c.name == 'acd'
+                else c
+                for c in blob_table.c
+            ]).where(blob_table.c.column_id == old_column_id)))
+        print(f"Cloned table {source.id} ({source.name}) as {returns_table.id} ({name})")
+        return returns_table
+
+    base_table = BaseCell.__table__
+    source_column_ids = [old_id for old_id, _ in column_pairs]
+    min_source_id, max_source_id = connection.execute(
+        select(func.min(base_table.c.id), func.max(base_table.c.id))
+        .where(base_table.c.column_id.in_(source_column_ids))
+    ).one()
+    if min_source_id is None:
+        return returns_table
+    offset = reserve_cell_ids(connection, max_source_id - min_source_id + 1) - min_source_id
+
+    for old_column_id, new_column in column_pairs:
+        names = [c.name for c in base_table.c]
+        connection.execute(insert(base_table).from_select(names, select(*[
+            (base_table.c.id + offset) if c.name == 'id'
+            else literal(new_column.id).label('column_id') if c.name == 'column_id'
+            else c
+            for c in base_table.c
+        ]).where(base_table.c.column_id == old_column_id)))
+
+        for model, _ in CELL_TYPES.values():
+            child_table = model.__table__
+            names = [c.name for c in child_table.c]
+            connection.execute(insert(child_table).from_select(names, select(*[
+                (child_table.c.id + offset) if c.name == 'id'
+                else literal(0).label('acd') if c.name == 'acd'
+                else c
+                for c in child_table.c
+            ]).join(base_table, base_table.c.id == child_table.c.id)
+              .where(base_table.c.column_id == old_column_id)))
+
+    print(f"Cloned table {source.id} ({source.name}) as {returns_table.id} ({name})")
+    return returns_table
+
+def iter_excel_chunks(file, na_values=(), chunksize=EXCEL_CHUNK_SIZE, text_positions=()):
+    """Stream the first worksheet of an .xlsx/.xlsm upload as DataFrame chunks.
+
+    The workbook is opened in openpyxl's read-only mode and rows are read straight from
+    the sheet XML, so only one chunk of rows is in memory at a time. The first row is the
+    header, as with pd.read_excel; strings in EXCEL_NA_STRINGS or `na_values` become
+    missing values and trailing empty rows are dropped.
+
+    Args:
+        file: Uploaded file object or path of the workbook.
+        na_values: Additional strings treated as missing values.
+        chunksize: Number of rows per yielded DataFrame.
+        text_positions: Positions of columns kept as the cell values read from the sheet
+            (object dtype), e.g. integers aren't turned into floats next to empty cells.
+
+    Yields:
+        pandas.DataFrame: Consecutive chunks of the sheet's data rows.
+    """
+    na_strings = EXCEL_NA_STRINGS | set(na_values)
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+
+        header = list(next(rows, None) or ())
+        while header and header[-1] is None:
+            header.pop()
+        column_names = []
+        for position, name in enumerate(header):
+            name = f"Unnamed: {position}" if name is None else name
+            # Mangle duplicate headers the way pandas does ("Ret", "Ret.1", ...)
+            base_name, suffix = name, 1
+            while name in column_names:
+                name = f"{base_name}.{suffix}"
+                suffix += 1
+            column_names.append(name)
+        width = len(column_names)
+
+        chunk = []
+        pending_empty = []
+        yielded = False
+        for row in rows:
+            values = [
+                None if isinstance(value, str) and value.strip() in na_strings else value
+                for value in row[:width]
+            ]
+            values.extend([None] * (width - len(values)))
+            if all(value is None for value in values):
+                pending_empty.append(values)
+                continue
+            chunk.extend(pending_empty)
+            pending_empty = []
+            chunk.append(values)
+            if len(chunk) >= chunksize:
+                yield excel_chunk_frame(chunk, column_names, text_positions)
+                yielded = True
+                chunk = []
+
+        # A header-only sheet still yields one empty chunk so its columns are created
+        if chunk or not yielded:
+            yield excel_chunk_frame(chunk, column_names, text_positions)
+    finally:
+        workbook.close()
+
+def excel_chunk_frame(rows, column_names, text_positions=()):
+    """Build a DataFrame from sheet rows, keeping the columns at `text_positions` as read."""
+    frame = pd.DataFrame(rows, columns=column_names)
+    for position in text_positions:
+        frame.isetitem(position, pd.Series([row[position] for row in rows], dtype=object))
+    return frame
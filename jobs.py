@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.datastructures import FileStorage
+from models import db
+from db_config import serialized_write
+from utils import extract_data_file
+
+# Jobs run on threads of the app process, where pandas is already imported by utils,
+# so a job starts parsing straight away instead of paying the import cost.
+# Job state lives in memory and is only visible to the process that accepted the upload.
+
+# Number of uploads processed concurrently
+UPLOAD_JOB_WORKERS = 2
+
+# Seconds a done or failed job can still be polled before it is forgotten
+FINISHED_JOB_TTL = 3600
+
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_JOB_WORKERS, thread_name_prefix="upload-job")
+_jobs = {}
+_finished_at = {}  # job id -> time.monotonic() when the job was done or failed
+_jobs_lock = threading.Lock()
+
+def submit_upload_job(app, path, filename):
+    """Queue an uploaded file for ingestion on the worker pool.
+
+    The upload must already be saved to `path`; the file is removed once the job ends.
+
+    Args:
+        app: Flask app instance the job runs under.
+        path: Path of the saved upload.
+        filename: Original filename, used as the ReturnsTable name.
+
+    Returns:
+        str: The job id to poll with get_job.
+    """
+    job_id = uuid.uuid4().hex
+    with _jobs_lock:
+        _prune_finished_jobs()
+        _jobs[job_id] = {
+            'id': job_id,
+            'filename': filename,
+            'status': 'queued',
+            'phase': 'queued',
+            'rows_ingested': 0,
+            'table_id': None,
+            'error': None
+        }
+    _executor.submit(_run_upload_job, app, job_id, path, filename)
+    return job_id
+
+def get_job(job_id):
+    """Return a copy of the job's status dict, or None for an unknown or expired job id."""
+    with _jobs_lock:
+        _prune_finished_jobs()
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+def _update_job(job_id, **fields):
+    with _jobs_lock:
+        _jobs[job_id].update(fields)
+        if fields.get('status') in ('done', 'failed'):
+            _finished_at[job_id] = time.monotonic()
+
+def _prune_finished_jobs():
+    """Forget the jobs finished more than FINISHED_JOB_TTL seconds ago; call with _jobs_lock held."""
+    expired_before = time.monotonic() - FINISHED_JOB_TTL
+    for job_id in [job_id for job_id, finished in _finished_at.items() if finished < expired_before]:
+        del _finished_at[job_id]
+        del _jobs[job_id]
+
+def _run_upload_job(app, job_id, path, filename):
+    with app.app_context():
+        try:
+            # Other uploads, merges and edits may be writing; wait for our turn
+            _update_job(job_id, status='running', phase='waiting to write')
+            with serialized_write(), open(path, 'rb') as stream:
+                _update_job(job_id, phase='reading')
+                upload = FileStorage(stream=stream, filename=filename)
+                returns_table, row_count = extract_data_file(
+                    upload, db,
+                    storage=app.config.get('RETURNS_STORAGE_BACKEND', 'cells'),
+                    progress=lambda rows: _update_job(job_id, phase='ingesting', rows_ingested=rows)
+                )
+                _update_job(job_id, phase='committing')
+                db.session.commit()
+            print(f"Upload job {job_id} created table: ID={returns_table.id}, Name={returns_table.name}")
+            _update_job(job_id, status='done', phase='done', rows_ingested=row_count,
+                        table_id=returns_table.id)
+        except Exception as e:
+            print(f"Error in upload job {job_id}: {str(e)}")
+            db.session.rollback()
+            _update_job(job_id, status='failed', phase='failed', error=str(e))
+        finally:
+            db.session.remove()
+            os.remove(path)
@@ -0,0 +1,47 @@
+"""Cell row position
+
+Revision ID: c4e8a7d19b02
+Revises: bce3833b8147
+Create Date: 2026-10-18 10:41:07.218934
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a7d19b02'
+down_revision = 'bce3833b8147'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app adds the column and its index at startup (migrate_cell_row_positions);
+    # this revision mirrors it for databases upgraded before the app has started
+    inspector = sa.inspect(op.get_bind())
+    if 'row_position' not in [column['name'] for column in inspector.get_columns('base_cells')]:
+        with op.batch_alter_table('base_cells', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('row_position', sa.Integer(), nullable=True))
+
+        # Backfill: row order used to be implied by insertion (id) order within each column
+        op.execute(
+            """
+            UPDATE base_cells SET row_position = numbered.position
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY column_id ORDER BY id) - 1 AS position
+                FROM base_cells
+            ) AS numbered
+            WHERE numbered.id = base_cells.id
+            """
+        )
+
+    if 'ix_base_cells_column_row' not in [index['name'] for index in inspector.get_indexes('base_cells')]:
+        with op.batch_alter_table('base_cells', schema=None) as batch_op:
+            batch_op.create_index('ix_base_cells_column_row', ['column_id', 'row_position'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('base_cells', schema=None) as batch_op:
+        batch_op.drop_index('ix_base_cells_column_row')
+        batch_op.drop_column('row_position')
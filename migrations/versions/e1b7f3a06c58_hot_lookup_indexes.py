@@ -0,0 +1,51 @@
+"""Hot lookup indexes
+
+Revision ID: e1b7f3a06c58
+Revises: c4e8a7d19b02
+Create Date: 2026-10-18 11:26:53.870412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1b7f3a06c58'
+down_revision = 'c4e8a7d19b02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app creates the columns and date_cells indexes at startup (migrate_lookup_indexes);
+    # this revision mirrors it for databases upgraded before the app has started
+    inspector = sa.inspect(op.get_bind())
+
+    # Columns of a table (get_table, get_columns, footnotes, merge)
+    if 'ix_columns_returns_table_id' not in [index['name'] for index in inspector.get_indexes('columns')]:
+        with op.batch_alter_table('columns', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_columns_returns_table_id'), ['returns_table_id'], unique=False)
+
+    # Articles of a table, and their publish dates for date matching. create_app moves
+    # factiva_articles into the shared article store (migrate_factiva_article_store), whose
+    # tables carry their own indexes, so there is nothing to index once it has started.
+    if inspector.has_table('factiva_articles'):
+        with op.batch_alter_table('factiva_articles', schema=None) as batch_op:
+            batch_op.create_index('ix_factiva_articles_table_date', ['returns_table_id', 'publish_date'], unique=False)
+
+    # Date matching on date cell values
+    if 'ix_date_cells_value' not in [index['name'] for index in inspector.get_indexes('date_cells')]:
+        with op.batch_alter_table('date_cells', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_date_cells_value'), ['value'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('date_cells', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_date_cells_value'))
+
+    if sa.inspect(op.get_bind()).has_table('factiva_articles'):
+        with op.batch_alter_table('factiva_articles', schema=None) as batch_op:
+            batch_op.drop_index('ix_factiva_articles_table_date')
+
+    with op.batch_alter_table('columns', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_columns_returns_table_id'))
@@ -1,24 +1,36 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import json
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm.attributes import flag_modified
 
 # Instantiate the database
 db = SQLAlchemy()
 
-# JSON serialization helper for SQLite
+# JSON serialization helper: TEXT on SQLite, native JSONB on PostgreSQL
 class JsonEncodedDict(db.TypeDecorator):
     """Enables JSON storage by encoding and decoding on the fly."""
     impl = db.Text
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(db.Text())
     
     def process_bind_param(self, value, dialect):
         if value is None:
-            return '{}'
+            value = {}
+        if dialect.name == 'postgresql':
+            # JSONB serializes the dict itself
+            return value
         return json.dumps(value)
         
     def process_result_value(self, value, dialect):
         if value is None:
             return {}
+        if dialect.name == 'postgresql':
+            return value
         return json.loads(value)
 
 class ReturnsTable(db.Model):
@@ -27,15 +39,23 @@ class ReturnsTable(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     upload_time = db.Column(db.DateTime, default=datetime.utcnow)  # Need to fix this
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 of the uploaded file bytes
+    storage = db.Column(db.String(10), nullable=False, default='cells', server_default='cells')  # 'cells' or 'blob'
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Bumped by every change to the table's contents
+    upload_columns = db.Column(db.Integer, nullable=True)  # Columns read from the uploaded file; later ones (merged Factiva fields) come after them
     
     # Note cascade delete to columns
     columns = db.relationship('Column', backref='returns_table', 
                             lazy=True, cascade='all, delete-orphan',
                             passive_deletes=True)
     
-    # Factiva articles relationship
-    factiva_articles = db.relationship('FactivaArticle', backref='returns_table',
-                                       lazy=True, cascade='all, delete-orphan')
+    # Factiva articles, shared with other tables through returns_table_articles
+    factiva_articles = db.relationship('FactivaArticle', secondary='returns_table_articles',
+                                       backref='returns_tables', lazy=True, passive_deletes=True)
+    
+    # Change log used by clients to catch up from an older version
+    changes = db.relationship('TableChange', lazy=True, cascade='all, delete-orphan',
+                              passive_deletes=True)
     
     # Removed footnotes relationship
 
@@ -45,23 +65,81 @@ class ReturnsTable(db.Model):
 
 # Remove Footnote model
 
-class FactivaArticle(db.Model):
-    __tablename__ = 'factiva_articles'
+class TableChange(db.Model):
+    """One change made to a returns table, recorded under the table version it produced."""
+    __tablename__ = 'table_changes'
     
     id = db.Column(db.Integer, primary_key=True)
-    returns_table_id = db.Column(db.Integer, 
+    returns_table_id = db.Column(db.Integer,
                                  db.ForeignKey('returns_tables.id', ondelete='CASCADE'),
                                  nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'column', 'cell', 'footnote' or 'table'
+    column_id = db.Column(db.Integer, nullable=True)
+    row = db.Column(db.Integer, nullable=True)  # Row of a cell or cell footnote; None for columns and headers
+    value = db.Column(JsonEncodedDict, nullable=True)  # e.g. {'acd': 1} or {'footnote': '...'}
+    
+    # Clients ask for the changes of one table after a given version
+    __table_args__ = (
+        db.Index('ix_table_changes_table_version', 'returns_table_id', 'version'),
+    )
+    
+    def __repr__(self):
+        return f"<TableChange(table={self.returns_table_id}, version={self.version}, kind={self.kind})>"
+
+class FactivaArticle(db.Model):
+    """A Factiva article, stored once however many returns tables it is linked to."""
+    __tablename__ = 'articles'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # SHA-256 of the normalized headline, publish date, source and content (see
+    # ingest.article_fingerprint); the same article uploaded again maps to this row
+    fingerprint = db.Column(db.String(64), nullable=False, unique=True)
     headline = db.Column(db.String, nullable=False)
     author = db.Column(db.String, nullable=True) 
     word_count = db.Column(db.Integer, nullable=True)  # changed to Integer
     publish_date = db.Column(db.DateTime, nullable=True)  # changed to DateTime
     source = db.Column(db.String, nullable=True)
-    content = db.Column(db.Text, nullable=True)
+    # Loaded only when accessed; listings read the other columns and SQL-side previews
+    content = db.deferred(db.Column(db.Text, nullable=True))
+    
+    # Articles are matched to returns dates by publish date
+    __table_args__ = (
+        db.Index('ix_articles_publish_date', 'publish_date'),
+    )
+    
+    @classmethod
+    def for_table(cls, table_id):
+        """Query the articles linked to a ReturnsTable, in the order they were linked."""
+        return (cls.query
+                .join(ReturnsTableArticle, ReturnsTableArticle.article_id == cls.id)
+                .filter(ReturnsTableArticle.returns_table_id == table_id)
+                .order_by(ReturnsTableArticle.id))
     
     def __repr__(self):
         return f"<FactivaArticle(headline={self.headline}, author={self.author})>"
 
+class ReturnsTableArticle(db.Model):
+    """Link between a ReturnsTable and a FactivaArticle uploaded for it."""
+    __tablename__ = 'returns_table_articles'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    returns_table_id = db.Column(db.Integer, 
+                                 db.ForeignKey('returns_tables.id', ondelete='CASCADE'),
+                                 nullable=False)
+    article_id = db.Column(db.Integer, 
+                           db.ForeignKey('articles.id', ondelete='CASCADE'),
+                           nullable=False)
+    
+    # A table links an article once; uploads skip the articles a table already has
+    __table_args__ = (
+        db.UniqueConstraint('returns_table_id', 'article_id', name='uq_returns_table_articles_table_article'),
+        db.Index('ix_returns_table_articles_article_id', 'article_id'),
+    )
+    
+    def __repr__(self):
+        return f"<ReturnsTableArticle(table={self.returns_table_id}, article={self.article_id})>"
+
 # COLUMN TABLES
 class Column(db.Model):
     __tablename__ = 'columns'
@@ -78,10 +156,15 @@ class Column(db.Model):
     # Add cascade delete to cells
     cells = db.relationship('BaseCell', backref='column', 
                           lazy=True, cascade='all, delete-orphan',
-                          passive_deletes=True)
+                          passive_deletes=True,
+                          order_by='(BaseCell.row_position, BaseCell.id)')
     
     returns_table_id = db.Column(db.Integer, db.ForeignKey('returns_tables.id', 
-                               ondelete='CASCADE'), nullable=False)
+                               ondelete='CASCADE'), nullable=False, index=True)
+
+    # Whole-column storage used by tables with storage='blob'
+    blob = db.relationship('ColumnBlob', uselist=False, cascade='all, delete-orphan',
+                           passive_deletes=True)
 
     __mapper_args__ = {
         'polymorphic_on': discriminator,
@@ -146,6 +229,28 @@ class TextColumn(Column):
     def __repr__(self):
         return f"<TextColumn(name={self.name})>"
 
+class ColumnBlob(db.Model):
+    """A whole column stored as one compressed typed array plus a null mask.
+
+    values holds zlib-compressed little-endian float64 (numbers), int64 nanoseconds
+    since the epoch (dates) or int64 offsets followed by UTF-8 bytes (text).
+    null_mask and acd are zlib-compressed bit/byte arrays with one entry per row.
+    """
+    __tablename__ = 'column_blobs'
+
+    column_id = db.Column(db.Integer, db.ForeignKey('columns.id', ondelete='CASCADE'),
+                          primary_key=True)
+    returns_table_id = db.Column(db.Integer, db.ForeignKey('returns_tables.id', ondelete='CASCADE'),
+                                 nullable=False, index=True)
+    kind = db.Column(db.String(10), nullable=False)  # 'date', 'number' or 'text'
+    length = db.Column(db.Integer, nullable=False)
+    values = db.Column(db.LargeBinary, nullable=False)
+    null_mask = db.Column(db.LargeBinary, nullable=False)
+    acd = db.Column(db.LargeBinary, nullable=True)  # Date columns only
+
+    def __repr__(self):
+        return f"<ColumnBlob(column_id={self.column_id}, kind={self.kind}, length={self.length})>"
+
 # CELL TABLES
 class BaseCell(db.Model):
     __tablename__ = 'base_cells'
@@ -153,8 +258,14 @@ class BaseCell(db.Model):
     color = db.Column(db.String(50))
     format = db.Column(db.String(10))
     column_id = db.Column(db.Integer, db.ForeignKey('columns.id'), nullable=False)
+    row_position = db.Column(db.Integer, nullable=True)  # 0-based row of the cell within its column
     discriminator = db.Column(db.String(50))
 
+    # Rows of a column (and aligned rows across columns) are looked up by position
+    __table_args__ = (
+        db.Index('ix_base_cells_column_row', 'column_id', 'row_position'),
+    )
+
     __mapper_args__ = {
         'polymorphic_on': discriminator,
         'polymorphic_identity': 'base_cell',
@@ -176,7 +287,7 @@ class DateCell(BaseCell):
     __tablename__ = 'date_cells'
     id = db.Column(db.Integer, db.ForeignKey('base_cells.id'), primary_key=True)
 
-    value = db.Column(db.DateTime)
+    value = db.Column(db.DateTime, index=True)
     acd = db.Column(db.Integer, default=0)  # 1 indicates an alleged corrective disclosure; 0 otherwise
 
     __mapper_args__ = {
@@ -188,7 +299,7 @@ class TextCell(BaseCell):
     __tablename__ = 'text_cells'
     id = db.Column(db.Integer, db.ForeignKey('base_cells.id'), primary_key=True)
 
-    value = db.Column(db.String(50))
+    value = db.Column(db.Text)
 
     __mapper_args__ = {
         'polymorphic_identity': 'text_cell',
@@ -1,10 +1,149 @@
-from bs4 import BeautifulSoup
+import multiprocessing
+import os
+import pickle
 import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache, partial
+from lxml import etree
 from dateutil.parser import parse as date_parse
 
+# Codes labelling the article rows we read: headline, source name (stored as author),
+# word count, publish date and publisher (stored as source)
+FIELD_CODES = ("HD", "SN", "WC", "PD", "PUB")
+
+# Processes parsing the files of one upload in parallel. Workers are started with 'spawn'
+# so they never inherit the app's database connections or locks, and only on first use.
+PARSE_WORKERS = os.cpu_count() or 1
+
+_parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS,
+                                  mp_context=multiprocessing.get_context("spawn"))
+
+# Articles handed to the database writer at a time
+ARTICLE_BATCH_SIZE = 500
+
+# Bytes read from an uploaded file at a time
+READ_CHUNK_BYTES = 64 * 1024
+
+# Opening tag of an article div, whatever the order of its attributes
+ARTICLE_TAG = re.compile(rb"""<div\b[^>]*\bclass=["']?article enArticle["'\s>]""", re.IGNORECASE)
+
+ARTICLE_PARSER = etree.HTMLParser(encoding="utf-8")
+
+# Publish date formats tried before falling back to dateutil, e.g. "31 January 2014"
+PUBLISH_DATE_FORMATS = ("%d %B %Y", "%d %b %Y", "%B %d, %Y", "%Y-%m-%d")
+
+# Format of the last parsed publish date; exports use one format throughout
+_last_date_format = PUBLISH_DATE_FORMATS[0]
+
+@lru_cache(maxsize=4096)
+def parse_publish_date(text):
+    """Parse a Factiva publish date, trying the known formats (last match first) before dateutil."""
+    global _last_date_format
+    # Read once: other request or job threads may be parsing dates at the same time
+    last_format = _last_date_format
+    for date_format in (last_format,) + PUBLISH_DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+        _last_date_format = date_format
+        return parsed
+    return date_parse(text)
+
+def element_text(element):
+    """Text of an element with each text node stripped, like BeautifulSoup's get_text(strip=True)."""
+    return "".join(text.strip() for text in element.itertext() if text.strip())
+
+def field_value_cell(label):
+    """Return the <td> holding the value of the row whose label is the <b> element `label`."""
+    cell = next(label.iterancestors("td"), None)
+    if cell is not None and cell.getnext() is not None and cell.getnext().tag == "td":
+        return cell.getnext()
+    following = label.xpath("following::td[1]")
+    return following[0] if following else None
+
+def parse_article(div):
+    """Parse one <div class="article enArticle"> element, reading only its own subtree.
+
+    Returns:
+        dict: The article's headline, author, word_count, publish_date, source and content.
+    """
+    values = {}
+    paragraphs = []
+    for element in div.iter("b", "p"):
+        if element.tag == "b":
+            code = "".join(element.itertext())
+            if code in FIELD_CODES and code not in values:
+                cell = field_value_cell(element)
+                values[code] = element_text(cell) if cell is not None else ""
+        elif "articleParagraph" in element.get("class", "").split():
+            paragraphs.append(element_text(element))
+
+    word_count_text = values.get("WC")
+    publish_date_text = values.get("PD")
+    return {
+        "headline": values.get("HD", "Unknown Headline"),
+        "author": values.get("SN", "Unknown Author"),
+        # Extract the integer from the word count string (e.g., "233 words")
+        "word_count": int(re.search(r"(\d+)", word_count_text).group(1)) if word_count_text else None,
+        # convert publish_date to datetime, or set to None if there is none
+        "publish_date": parse_publish_date(publish_date_text) if publish_date_text else None,
+        "source": values.get("PUB", "Unknown Source"),
+        "content": "\n".join(paragraphs)
+    }
+
+def iter_html_articles(source):
+    """
+    Yield the articles of a Factiva HTML file one at a time while it is being read.
+
+    libxml2's incremental HTML parser keeps every byte fed to it, so the file is instead
+    cut at each article's opening tag and every article is parsed on its own; memory use
+    is bounded by the largest article rather than the file.
+
+    Args:
+        source: File path, or binary file object such as an uploaded file's stream.
+
+    Yields:
+        dict: One article, see parse_html_articles.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as stream:
+            yield from iter_html_articles(stream)
+        return
+
+    for markup in _iter_article_markup(source):
+        root = etree.fromstring(markup, ARTICLE_PARSER)
+        # The markup runs up to the next article, so the first matching div is this article
+        div = next((div for div in root.iter("div") if div.get("class") == "article enArticle"), None)
+        if div is not None:
+            yield parse_article(div)
+
+def _iter_article_markup(stream):
+    """Yield the bytes from each article's opening tag up to the next one (or the end)."""
+    pending = b""
+    for data in iter(partial(stream.read, READ_CHUNK_BYTES), b""):
+        pending += data
+        starts = [match.start() for match in ARTICLE_TAG.finditer(pending)]
+        if not starts:
+            # Nothing before the first article is needed, except a tag cut off by the read
+            pending = pending[pending.rfind(b"<"):] if b"<" in pending else b""
+            continue
+        for article_start, next_start in zip(starts, starts[1:]):
+            yield pending[article_start:next_start]
+        pending = pending[starts[-1]:]
+    if ARTICLE_TAG.match(pending):
+        yield pending
+
 def parse_html_articles(html_path):
     """
-    Parse all articles from the Factiva HTML file, generating IDs dynamically.
+    Parse all articles from the Factiva HTML file.
+
+    Each article is read from its own subtree with lxml, so a field missing from one
+    article is never taken from the next one.
 
     Args:
         html_path (str): The file path to the HTML file containing the articles.
@@ -12,7 +151,6 @@ def parse_html_articles(html_path):
     Returns:
         list: A list of dictionaries, each containing the parsed details of an article.
               Each dictionary has the following keys:
-              - id (str): The unique identifier for the article.
               - headline (str): The headline of the article.
               - author (str): The author of the article.
               - word_count (int): The word count of the article.
@@ -20,47 +158,93 @@ def parse_html_articles(html_path):
               - source (str): The source of the article.
               - content (str): The main content of the article.
     """
-    with open(html_path, "r", encoding="utf-8") as file:
-        soup = BeautifulSoup(file, "html.parser")
-
-    articles = []
-    for i, div in enumerate(soup.find_all("div", class_="article enArticle")):
-        headline = (
-            div.find_next("b", string="HD").find_next("td").get_text(strip=True)
-            if div.find_next("b", string="HD") else "Unknown Headline"
-        )
-        author = (
-            div.find_next("b", string="SN").find_next("td").get_text(strip=True)
-            if div.find_next("b", string="SN") else "Unknown Author"
-        )
-        word_count_text = (
-            div.find_next("b", string="WC").find_next("td").get_text(strip=True)
-            if div.find_next("b", string="WC") else None
-        )
-        # Extract the integer from the word count string (e.g., "233 words")
-        word_count = int(re.search(r"(\d+)", word_count_text).group(1)) if word_count_text else None
-
-        publish_date_text = (
-            div.find_next("b", string="PD").find_next("td").get_text(strip=True)
-            if div.find_next("b", string="PD") else None
-        )
-        # convert publish_date to datetime, or set to None if parsing fails
-        publish_date = date_parse(publish_date_text) if publish_date_text else None
-
-        source = (
-            div.find_next("b", string="PUB").find_next("td").get_text(strip=True)
-            if div.find_next("b", string="PUB") else "Unknown Source"
-        )
-        content = "\n".join(
-            [p.get_text(strip=True) for p in div.find_all("p", class_="articleParagraph")]
-        )
-        articles.append({
-            "headline": headline,
-            "author": author,
-            "word_count": word_count,
-            "publish_date": publish_date,
-            "source": source,
-            "content": content
-        })
+    articles = list(iter_html_articles(html_path))
     print(f"Total articles parsed: {len(articles)}")
     return articles
+
+def spool_article_batches(source, batch_size=ARTICLE_BATCH_SIZE):
+    """
+    Parse a Factiva HTML file into a temporary file of pickled article batches.
+
+    The articles are streamed from `source` and written a batch at a time, so memory
+    use is bounded by one batch whatever the size of the file.
+
+    Args:
+        source: File path, or binary file object such as an uploaded file's stream.
+        batch_size (int): Maximum number of articles per batch.
+
+    Returns:
+        str: Path of the spool file; read it with iter_spooled_batches, then remove it.
+    """
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".articles") as spool:
+        try:
+            for batch in _batched(iter_html_articles(source), batch_size):
+                pickle.dump(batch, spool, protocol=pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            spool.close()
+            os.remove(spool.name)
+            raise
+    return spool.name
+
+def iter_spooled_batches(path):
+    """Yield the article batches of a spool file written by spool_article_batches, one at a time."""
+    with open(path, "rb") as spool:
+        while True:
+            try:
+                yield pickle.load(spool)
+            except EOFError:
+                return
+
+@contextmanager
+def parsed_article_batches(files, batch_size=ARTICLE_BATCH_SIZE):
+    """
+    Parse several uploaded Factiva files, then iterate over their articles in batches.
+
+    Every file is parsed when the block is entered, before the caller takes its database
+    write turn: on the parse worker processes when there are several files and CPUs
+    (each file is first copied to a temporary file), otherwise streamed in this process.
+    Parsed batches are spooled to temporary files rather than sent back whole, so memory
+    use is bounded by one batch per process; the files are removed when the block exits.
+
+    Args:
+        files (list): Binary file objects, e.g. the streams of the uploaded files.
+        batch_size (int): Maximum number of articles per batch.
+
+    Yields:
+        iterator: Lists of at most `batch_size` articles (see parse_html_articles), in file order.
+    """
+    html_paths = []
+    spool_paths = []
+    try:
+        if len(files) <= 1 or PARSE_WORKERS == 1:
+            for stream in files:
+                spool_paths.append(spool_article_batches(stream, batch_size))
+        else:
+            for stream in files:
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".html") as tmp:
+                    html_paths.append(tmp.name)
+                    shutil.copyfileobj(stream, tmp)
+            futures = [_parse_pool.submit(spool_article_batches, path, batch_size) for path in html_paths]
+            # Collect every worker's spool file, even after a failure, so all of them are removed
+            errors = []
+            for future in futures:
+                try:
+                    spool_paths.append(future.result())
+                except Exception as e:
+                    errors.append(e)
+            if errors:
+                raise errors[0]
+        yield (batch for path in spool_paths for batch in iter_spooled_batches(path))
+    finally:
+        for path in html_paths + spool_paths:
+            os.remove(path)
+
+def _batched(articles, batch_size):
+    batch = []
+    for article in articles:
+        batch.append(article)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -1,13 +1,55 @@
-from flask import Blueprint, render_template, request, jsonify, send_file
-from models import db, ReturnsTable, Column, DateCell, FactivaArticle, DateColumn, TextColumn, TextCell
-from utils import extract_data_file, convert_ReturnsTable_to_html
-from parse_html_articles import parse_html_articles  
+from flask import Blueprint, render_template, request, jsonify, send_file, current_app
+from models import (db, ReturnsTable, Column, ColumnBlob, DateCell, ReturnsTableArticle,
+                    DateColumn, TextColumn)
+from utils import (extract_data_file, convert_ReturnsTable_to_html, convert_ReturnsTable_to_html_shell,
+                   iter_ReturnsTable_html, convert_rows_to_datatables, convert_ReturnsTable_to_columns, DATE_FORMATS,
+                   MERGE_FIELDS, merge_articles_by_date)
+from ingest import write_column_values, insert_factiva_articles
+from table_store import (get_returns_table, load_column, load_row_window, set_blob_acd,
+                         load_table_articles, count_table_articles, load_article_frame,
+                         ARTICLE_FIELDS)
+from parse_html_articles import parsed_article_batches
+import os
 import tempfile
 from chron import create_excel_from_table_data
+from jobs import submit_upload_job, get_job
+from db_config import serialized_write
+from table_cache import (cached_table_response, streamed_table_response, bump_table_version,
+                         get_table_version, load_table_changes)
+from article_search import search_articles, DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from datetime import date, datetime, timedelta
+from sqlalchemy import insert, literal, select
 
 
 main_blueprint = Blueprint('main', __name__)
 
+# Sent by /get_table for a table without columns
+EMPTY_TABLE_HTML = '<table id="returnsTable" class="display"><thead><tr><th>No data available</th></tr></thead><tbody><tr><td>This table is empty</td></tr></tbody></table>'
+
+def article_page_args(default_fields):
+    """
+    Read the fields, offset and limit query parameters of the article listing routes.
+
+    Args:
+        default_fields: Fields returned when the request doesn't name any.
+
+    Returns:
+        tuple: (fields, offset, limit); limit is None when the request asks for every article.
+
+    Raises:
+        ValueError: If a field is unknown or offset/limit isn't a non-negative integer.
+    """
+    fields = request.args.get('fields')
+    fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else default_fields
+    unknown = [field for field in fields if field not in ARTICLE_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"fields must be a comma-separated subset of {', '.join(ARTICLE_FIELDS)}")
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("offset and limit must be non-negative integers")
+    return fields, offset, limit
+
 @main_blueprint.route("/")
 def index():
     tables = ReturnsTable.query.all()
@@ -17,21 +59,177 @@ def index():
 @main_blueprint.route("/get_table/<int:table_id>")
 def get_table(table_id):
     try:
-        returns_table = ReturnsTable.query.get(table_id)
+        # ?server_side=1 sends only the header; DataTables then pages through /get_table_rows
+        server_side = request.args.get('server_side') == '1'
+
+        def render_shell():
+            returns_table = get_returns_table(table_id)
+            if not returns_table.columns:
+                return {'table_html': EMPTY_TABLE_HTML}
+            return {'table_html': convert_ReturnsTable_to_html_shell(returns_table)}
+
+        def render_chunks():
+            # The table and its columns come back in one query, then the cells one batch of rows at a time
+            returns_table = get_returns_table(table_id)
+            # The HTML is sent as the JSON string {"table_html": "..."}, escaped chunk by chunk
+            yield '{"table_html": "'
+            chunks = iter_ReturnsTable_html(returns_table) if returns_table.columns else [EMPTY_TABLE_HTML]
+            for chunk in chunks:
+                yield current_app.json.dumps(chunk)[1:-1]
+            yield '"}'
+
+        # Repeat loads of an unchanged table are answered from the render cache or with a 304;
+        # otherwise the full table is streamed as it renders
+        if server_side:
+            response = cached_table_response(table_id, 'html_shell', render_shell)
+        else:
+            response = streamed_table_response(table_id, 'html', render_chunks)
         # Ensure the table exists
+        if response is None:
+            return jsonify({'error': f"Table {table_id} not found"}), 404
+        return response
+    except Exception as e:
+        print(f"Error getting table {table_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@main_blueprint.route("/get_table_columns/<int:table_id>")
+def get_table_columns(table_id):
+    """
+    Return a returns table as typed column arrays instead of HTML.
+
+    Query parameters:
+        - columns: Optional comma-separated column ids; only these columns are sent
+        - dates: 'iso' (default, 'YYYY-MM-DD' strings) or 'epoch_days' (days since 1970-01-01)
+
+    Returns:
+        JSON with table_id, name, row_count and columns (id, name, kind, values and,
+        for date columns, acd as a string of '0'/'1' flags). Carries an ETag; an
+        unchanged table is answered with 304 Not Modified.
+    """
+    try:
+        column_ids = None
+        if request.args.get('columns'):
+            try:
+                column_ids = [int(column_id) for column_id in request.args['columns'].split(',') if column_id.strip()]
+            except ValueError:
+                return jsonify({'error': "columns must be a comma-separated list of column ids"}), 400
+
+        date_format = request.args.get('dates', 'iso')
+        if date_format not in DATE_FORMATS:
+            return jsonify({'error': f"dates must be one of {', '.join(DATE_FORMATS)}"}), 400
+
+        def render():
+            return convert_ReturnsTable_to_columns(get_returns_table(table_id), column_ids, date_format)
+
+        variant = f"columns:{','.join(map(str, column_ids)) if column_ids is not None else '*'}:{date_format}"
+        response = cached_table_response(table_id, variant, render)
+        if response is None:
+            return jsonify({'error': f"Table {table_id} not found"}), 404
+        return response
+    except Exception as e:
+        print(f"Error getting columns of table {table_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@main_blueprint.route("/get_table_changes/<int:table_id>")
+def get_table_changes(table_id):
+    """
+    Return what changed in a returns table since a version the client already holds.
+
+    Query parameters:
+        - since: The version the client loaded ('version' of /get_table_columns, or the
+          data-version attribute of the /get_table table)
+        - dates: Format of added columns' date values, as for /get_table_columns
+
+    Returns:
+        JSON with table_id, version (the current one), reset, changes and columns.
+        changes lists {version, kind, column_id, row, value} in the order they were made:
+            - column: column_id was added; its values are in columns
+            - cell: the date cell at (column_id, row) now has the ACD flag value['acd']
+            - footnote: the footnote of (column_id, row) is now value['footnote'] (row null = header)
+        reset is true when the changes can't be replayed (the client is too far behind or
+        the table changed in another way) and the client should reload the whole table.
+    """
+    try:
+        since = request.args.get('since', type=int)
+        if since is None:
+            return jsonify({'error': "since must be a table version"}), 400
+
+        date_format = request.args.get('dates', 'iso')
+        if date_format not in DATE_FORMATS:
+            return jsonify({'error': f"dates must be one of {', '.join(DATE_FORMATS)}"}), 400
+
+        row = get_table_version(table_id)
+        if row is None:
+            return jsonify({'error': f"Table {table_id} not found"}), 404
+        version = row.version
+
+        changes = load_table_changes(table_id, since, version)
+        response = {'table_id': table_id, 'version': version, 'reset': changes is None,
+                    'changes': [], 'columns': []}
+        if changes is None:
+            return jsonify(response)
+
+        response['changes'] = [{
+            'version': change.version,
+            'kind': change.kind,
+            'column_id': change.column_id,
+            'row': change.row,
+            'value': change.value
+        } for change in changes]
+
+        # Send the values of added columns along, so the client needs no second request
+        added_column_ids = [change.column_id for change in changes if change.kind == 'column']
+        if added_column_ids:
+            returns_table = get_returns_table(table_id)
+            response['columns'] = convert_ReturnsTable_to_columns(
+                returns_table, added_column_ids, date_format)['columns']
+        return jsonify(response)
+    except Exception as e:
+        print(f"Error getting changes of table {table_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@main_blueprint.route("/get_table_rows/<int:table_id>")
+def get_table_rows(table_id):
+    """
+    Serve one page of a returns table using the DataTables server-side protocol.
+
+    Query parameters (sent by DataTables):
+        - draw: Request counter, echoed back
+        - start, length: First row and number of rows of the page (length -1 = all rows)
+        - order[0][column], order[0][dir]: Index of the column to sort by and 'asc'/'desc'
+        - search[value]: Text a row must contain in one of its cells
+
+    Returns:
+        JSON with draw, recordsTotal, recordsFiltered and data (the page's rows)
+    """
+    try:
+        returns_table = get_returns_table(table_id)
         if returns_table is None:
             return jsonify({'error': f"Table {table_id} not found"}), 404
 
-        # Ensure the table has columns
-        if not returns_table.columns:
-            return jsonify({'table_html': '<table id="returnsTable" class="display"><thead><tr><th>No data available</th></tr></thead><tbody><tr><td>This table is empty</td></tr></tbody></table>'})
-        
-        # Use a fresh session to ensure we get the latest data
-        db.session.refresh(returns_table)
-        table_html = convert_ReturnsTable_to_html(returns_table)
-        return jsonify({'table_html': table_html})
+        draw = request.args.get('draw', 0, type=int)
+        start = max(request.args.get('start', 0, type=int), 0)
+        length = request.args.get('length', 100, type=int)
+        search = request.args.get('search[value]', '').strip()
+
+        order_column_id = None
+        order_index = request.args.get('order[0][column]', type=int)
+        columns = sorted(returns_table.columns, key=lambda c: c.id)
+        if order_index is not None and 0 <= order_index < len(columns):
+            order_column_id = columns[order_index].id
+        descending = request.args.get('order[0][dir]') == 'desc'
+
+        page, row_positions, records_total, records_filtered = load_row_window(
+            returns_table, start=start, length=length if length >= 0 else None,
+            order_column_id=order_column_id, descending=descending, search=search or None)
+        return jsonify({
+            'draw': draw,
+            'recordsTotal': records_total,
+            'recordsFiltered': records_filtered,
+            'data': convert_rows_to_datatables(page, row_positions)
+        })
     except Exception as e:
-        print(f"Error getting table {table_id}: {str(e)}")
+        print(f"Error getting rows of table {table_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @main_blueprint.route("/", methods=["POST"])
@@ -49,25 +247,27 @@ def upload_and_display():
                 tables = ReturnsTable.query.all()
                 return render_template("returnstable.html", returns_tables=tables, error="Please upload a correct file type.")
 
-            # Start a new session for the upload
-            db.session.begin()
-            
-            # Get the returns table and dataframe
-            
-            returns_table, df = extract_data_file(uploaded_file, db)
-            
-            # Ensure the returns_table is attached to the current session
-            returns_table = db.session.merge(returns_table)
-            
-            print(f"Created new table: ID={returns_table.id}, Name={returns_table.name}")
-            # Instead of df.to_html(...), unify the final HTML structure:
-            table_html = convert_ReturnsTable_to_html(returns_table)
-            
-            # Get fresh list of tables
-            tables = ReturnsTable.query.all()
-            
-            # Commit the session
-            db.session.commit()
+            # Wait for our turn in the write queue; readers are not blocked meanwhile
+            with serialized_write():
+                # Start a new session for the upload
+                db.session.begin()
+
+                # Get the returns table and the number of rows stored
+                returns_table, row_count = extract_data_file(
+                    uploaded_file, db, storage=current_app.config.get('RETURNS_STORAGE_BACKEND', 'cells'))
+
+                # Ensure the returns_table is attached to the current session
+                returns_table = db.session.merge(returns_table)
+
+                print(f"Created new table: ID={returns_table.id}, Name={returns_table.name}")
+                # Instead of df.to_html(...), unify the final HTML structure:
+                table_html = convert_ReturnsTable_to_html(returns_table)
+
+                # Get fresh list of tables
+                tables = ReturnsTable.query.all()
+
+                # Commit the session
+                db.session.commit()
             
             # Get fresh debug info
             debug_info_html = render_template(
@@ -106,6 +306,49 @@ def upload_and_display():
     # Updated template name from "index.html" to "returnstable.html"
     return render_template("returnstable.html", returns_tables=tables)
 
+@main_blueprint.route("/upload_jobs", methods=["POST"])
+def create_upload_job():
+    """
+    Accept a returns file upload and ingest it in the background.
+    The file is saved to disk and queued on the upload worker pool; poll
+    /upload_jobs/<job_id> for progress and the new table id.
+    """
+    try:
+        uploaded_file = request.files.get('file')
+        if not uploaded_file or uploaded_file.filename == '':
+            return jsonify({"error": "No file selected."}), 400
+
+        filename = uploaded_file.filename
+        if not (filename.endswith('.xlsx') or filename.endswith('.xls') or filename.endswith('.csv') or filename.endswith('.xlsm')):
+            return jsonify({"error": "Please upload a correct file type."}), 400
+
+        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1]) as tmp:
+            uploaded_file.save(tmp)
+
+        job_id = submit_upload_job(current_app._get_current_object(), tmp.name, filename)
+        return jsonify({"job_id": job_id, "status": "queued"}), 202
+    except Exception as e:
+        print(f"Error queuing upload: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@main_blueprint.route("/upload_jobs/<job_id>")
+def upload_job_status(job_id):
+    """
+    Report an upload job's status, phase and rows ingested so far.
+    Finished jobs also include the new table id and the refreshed table list.
+    """
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Upload job {job_id} not found"}), 404
+
+    if job['status'] == 'done':
+        tables = ReturnsTable.query.all()
+        job['tables'] = [{
+            'id': table.id,
+            'name': f"{table.name} - Uploaded: {table.upload_time.strftime('%Y-%m-%d %H:%M:%S') if table.upload_time else 'N/A'}"
+        } for table in tables]
+    return jsonify(job)
+
 @main_blueprint.route("/chron", methods=["GET", "POST"])
 def chron():
     """
@@ -121,32 +364,27 @@ def chron():
             returns_table_id = int(returns_table_id)
             
             factiva_files = request.files.getlist("factiva_files")
-            total_articles_uploaded = 0
             
-            for f in factiva_files:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".html") as tmp:
-                    f.save(tmp.name)
-                    articles = parse_html_articles(tmp.name)  
-                    for art in articles:
-                        new_article = FactivaArticle(
-                            returns_table_id=returns_table_id,
-                            headline=art["headline"],
-                            author=art["author"],
-                            word_count=art["word_count"],
-                            publish_date=art["publish_date"],
-                            source=art["source"],
-                            content=art["content"]
-                        )
-                        db.session.add(new_article)
-                        total_articles_uploaded += 1
-            db.session.commit()
-            
-            # Query all factiva articles for the given table
-            factiva_articles = FactivaArticle.query.filter_by(returns_table_id=returns_table_id).all()
-            factiva_articles_data = [{"headline": article.headline, "author": article.author} 
-                                     for article in factiva_articles]
+            # Articles are parsed before taking the write turn, then written batch by batch
+            # (COPY on PostgreSQL), in one transaction, without holding every article in memory
+            with parsed_article_batches([f.stream for f in factiva_files]) as batches, serialized_write():
+                total_articles_uploaded = 0
+                total_articles_skipped = 0
+                factiva_articles_data = []
+                for batch in batches:
+                    new_articles = insert_factiva_articles(db.session.connection(), returns_table_id, batch)
+                    total_articles_uploaded += len(new_articles)
+                    total_articles_skipped += len(batch) - len(new_articles)
+                    # The response lists the new articles only, not every article of the table
+                    factiva_articles_data.extend({"headline": article["headline"], "author": article["author"]}
+                                                 for article in new_articles)
+                db.session.commit()
+
             response = {
-                "message": f"Factiva articles uploaded successfully ({total_articles_uploaded} articles added)",
+                "message": (f"Factiva articles uploaded successfully ({total_articles_uploaded} articles added, "
+                            f"{total_articles_skipped} duplicates skipped)"),
+                "articles_added": total_articles_uploaded,
+                "articles_skipped": total_articles_skipped,
                 "factiva_articles": factiva_articles_data
             }
             return jsonify(response)
@@ -184,32 +422,26 @@ def upload_factiva():
         if not factiva_files or len(factiva_files) == 0:
             return jsonify({"error": "No files provided"}), 400
             
-        total_articles_uploaded = 0
-        
-        for f in factiva_files:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".html") as tmp:
-                f.save(tmp.name)
-                articles = parse_html_articles(tmp.name)  
-                for art in articles:
-                    new_article = FactivaArticle(
-                        returns_table_id=returns_table_id,
-                        headline=art["headline"],
-                        author=art["author"],
-                        word_count=art["word_count"],
-                        publish_date=art["publish_date"],
-                        source=art["source"],
-                        content=art["content"]
-                    )
-                    db.session.add(new_article)
-                    total_articles_uploaded += 1
-        db.session.commit()
-        
-        # Query all factiva articles for the given table
-        factiva_articles = FactivaArticle.query.filter_by(returns_table_id=returns_table_id).all()
-        factiva_articles_data = [{"headline": article.headline, "author": article.author} 
-                                for article in factiva_articles]
+        # Articles are parsed before taking the write turn, then written batch by batch
+        # (COPY on PostgreSQL), in one transaction, without holding every article in memory
+        with parsed_article_batches([f.stream for f in factiva_files]) as batches, serialized_write():
+            total_articles_uploaded = 0
+            total_articles_skipped = 0
+            factiva_articles_data = []
+            for batch in batches:
+                new_articles = insert_factiva_articles(db.session.connection(), returns_table_id, batch)
+                total_articles_uploaded += len(new_articles)
+                total_articles_skipped += len(batch) - len(new_articles)
+                # The response lists the new articles only, not every article of the table
+                factiva_articles_data.extend({"headline": article["headline"], "author": article["author"]}
+                                             for article in new_articles)
+            db.session.commit()
+
         response = {
-            "message": f"Factiva articles uploaded successfully ({total_articles_uploaded} articles added)",
+            "message": (f"Factiva articles uploaded successfully ({total_articles_uploaded} articles added, "
+                        f"{total_articles_skipped} duplicates skipped)"),
+            "articles_added": total_articles_uploaded,
+            "articles_skipped": total_articles_skipped,
             "factiva_articles": factiva_articles_data
         }
         return jsonify(response)
@@ -245,7 +477,22 @@ def update_datecell_acd():
         data = request.get_json()
         cell_id = data.get("cell_id")
         acd_value = data.get("acd")
-        if cell_id is None or acd_value is None:
+        if acd_value is None:
+            return jsonify({"error": "Missing cell_id or acd value"}), 400
+
+        # Blob-stored tables have no cell rows; their date cells are addressed by column and row
+        if cell_id is None and data.get("column_id") is not None and data.get("row") is not None:
+            # The whole flag array is rewritten, so read and write it within one write turn
+            with serialized_write():
+                acd = set_blob_acd(int(data["column_id"]), int(data["row"]), acd_value)
+                if acd is None:
+                    return jsonify({"error": "Date cell not found"}), 404
+                bump_table_version(db.session.get(ColumnBlob, int(data["column_id"])).returns_table_id, [
+                    {'kind': 'cell', 'column_id': int(data["column_id"]), 'row': int(data["row"]), 'value': {'acd': acd}}])
+                db.session.commit()
+            return jsonify({"message": "ACD updated successfully", "acd": acd})
+
+        if cell_id is None:
             return jsonify({"error": "Missing cell_id or acd value"}), 400
 
         date_cell = db.session.query(DateCell).get(cell_id)
@@ -253,7 +500,11 @@ def update_datecell_acd():
             return jsonify({"error": "DateCell not found"}), 404
 
         date_cell.acd = int(acd_value)
-        db.session.commit()
+        with serialized_write():
+            bump_table_version(date_cell.column.returns_table_id, [
+                {'kind': 'cell', 'column_id': date_cell.column_id, 'row': date_cell.row_position,
+                 'value': {'acd': date_cell.acd}}])
+            db.session.commit()
         return jsonify({"message": "ACD updated successfully", "acd": date_cell.acd})
     except Exception as e:
         db.session.rollback()
@@ -261,30 +512,135 @@ def update_datecell_acd():
 
 @main_blueprint.route("/get_factiva_articles/<int:table_id>")
 def get_factiva_articles(table_id):
+    """
+    List the Factiva articles linked to a returns table.
+
+    Query parameters (see article_page_args):
+        - fields: Comma-separated article fields (default headline,author)
+        - offset, limit: The page of articles to return (default all of them)
+
+    Returns:
+        JSON with factiva_articles (one object per article with the requested fields) and
+        total, the number of articles linked to the table.
+    """
+    try:
+        fields, offset, limit = article_page_args(['headline', 'author'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return jsonify({
+            'factiva_articles': load_table_articles(table_id, fields, offset, limit),
+            'total': count_table_articles(table_id)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main_blueprint.route("/link_factiva_articles", methods=["POST"])
+def link_factiva_articles():
+    """
+    Attach the Factiva articles of one returns table to another, without uploading them again.
+
+    The articles are stored once and only linked, so tables sharing a news set (peer
+    companies, a re-uploaded return series) share its storage.
+
+    POST Parameters:
+        - table_id: ID of the ReturnsTable to link the articles to
+        - source_table_id: ID of the ReturnsTable whose articles are linked
+
+    Returns:
+        JSON with a message and articles_added (articles the table didn't have yet)
+    """
+    try:
+        data = request.json or {}
+        table_id = data.get('table_id')
+        source_table_id = data.get('source_table_id')
+        if not table_id or not source_table_id:
+            return jsonify({"error": "Missing required fields (table_id or source_table_id)"}), 400
+        for returns_table_id in (table_id, source_table_id):
+            if db.session.get(ReturnsTable, returns_table_id) is None:
+                return jsonify({"error": f"Returns table not found with ID {returns_table_id}"}), 404
+
+        already_linked = (select(ReturnsTableArticle.article_id)
+                          .where(ReturnsTableArticle.returns_table_id == table_id))
+        with serialized_write():
+            result = db.session.execute(insert(ReturnsTableArticle).from_select(
+                ['returns_table_id', 'article_id'],
+                select(literal(table_id), ReturnsTableArticle.article_id)
+                .where(ReturnsTableArticle.returns_table_id == source_table_id,
+                       ReturnsTableArticle.article_id.not_in(already_linked))
+                .order_by(ReturnsTableArticle.id)))
+            db.session.commit()
+
+        return jsonify({
+            "message": f"Factiva articles linked successfully ({result.rowcount} articles added)",
+            "articles_added": result.rowcount
+        })
+    except Exception as e:
+        print(f"Error linking Factiva articles: {str(e)}")
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@main_blueprint.route("/search_factiva_articles")
+def search_factiva_articles():
+    """
+    Full-text search over the headlines and content of Factiva articles.
+
+    Query parameters:
+        - q: Words to search for; hits contain all of them
+        - table_id: Only search the articles of this returns table
+        - start, end: Only return articles published from start to end (YYYY-MM-DD, inclusive)
+        - limit: Maximum number of hits (default 50, at most 500)
+
+    Returns:
+        JSON with the query and results, best matches first; each hit has the article's id,
+        headline, author, publish_date, source, rank and an HTML snippet with the matching
+        words in <mark>.
+    """
     try:
-        articles = FactivaArticle.query.filter_by(returns_table_id=table_id).all()
-        articles_data = [{"headline": article.headline, "author": article.author} for article in articles]
-        return jsonify({'factiva_articles': articles_data})
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': "q must name the words to search for"}), 400
+
+        try:
+            start = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+            end = date.fromisoformat(request.args['end']) if request.args.get('end') else None
+        except ValueError:
+            return jsonify({'error': "start and end must be dates (YYYY-MM-DD)"}), 400
+
+        limit = min(max(request.args.get('limit', DEFAULT_SEARCH_LIMIT, type=int), 1), MAX_SEARCH_LIMIT)
+        results = search_articles(
+            query,
+            table_id=request.args.get('table_id', type=int),
+            start=datetime.combine(start, datetime.min.time()) if start else None,
+            # Articles published at any time on the end date are included
+            end=datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None,
+            limit=limit)
+        return jsonify({'query': query, 'results': results})
     except Exception as e:
+        print(f"Error searching Factiva articles: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # New route to get full factiva article metadata
 @main_blueprint.route("/get_factiva_metadata/<int:table_id>")
 def get_factiva_metadata(table_id):
+    """
+    List the Factiva articles of a returns table with their metadata and a content preview.
+
+    Query parameters (see article_page_args):
+        - fields: Comma-separated article fields (default all of ARTICLE_FIELDS)
+        - offset, limit: The page of articles to return (default all of them)
+
+    Returns:
+        JSON with articles, total (the number of articles linked to the table) and the
+        columns a client can show.
+    """
     try:
-        articles = FactivaArticle.query.filter_by(returns_table_id=table_id).all()
-        
-        # Include all available metadata fields
-        articles_data = [{
-            "id": article.id,
-            "headline": article.headline,
-            "author": article.author,
-            "word_count": article.word_count,
-            "publish_date": article.publish_date.isoformat() if article.publish_date else None,
-            "source": article.source,
-            # Truncate content for preview
-            "content_preview": article.content[:100] + "..." if article.content and len(article.content) > 100 else article.content
-        } for article in articles]
+        fields, offset, limit = article_page_args(list(ARTICLE_FIELDS))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        # content_preview holds the first ARTICLE_PREVIEW_CHARS characters, cut in SQL
+        articles_data = load_table_articles(table_id, fields, offset, limit)
         
         # Get available columns for the table
         columns = [
@@ -298,7 +654,8 @@ def get_factiva_metadata(table_id):
         
         return jsonify({
             'articles': articles_data,
-            'columns': columns
+            'total': count_table_articles(table_id),
+            'columns': [column for column in columns if column['id'] in fields]
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -314,13 +671,14 @@ def merge_factiva_data():
     
     The merge process:
     1. Finds the DateColumn in the selected ReturnsTable
-    2. Gets all FactivaArticles related to the ReturnsTable
-    3. Indexes articles by their publish date for efficient lookup
-    4. For each DateCell in the DateColumn, finds articles with matching publish dates
-    5. Creates new TextColumns for each selected field (headline, author, etc.)
-    6. For each date cell, creates a corresponding text cell with article data
+    2. Loads the selected fields of all FactivaArticles related to the ReturnsTable
+       into a DataFrame
+    3. Merges the dates with the articles on their publish day (see
+       merge_articles_by_date), producing each selected field's whole column at once
        - If multiple articles match a date, uses the first one
        - If no articles match, creates an empty cell to maintain alignment
+    4. Creates new TextColumns for each selected field (headline, author, etc.)
+    5. Writes each whole column through the table's storage backend (cells or blob)
     
     POST Parameters:
         - table_id: ID of the ReturnsTable
@@ -361,111 +719,51 @@ def merge_factiva_data():
         if not date_column:
             return jsonify({"error": "No date column found in returns table"}), 400
         
-        # Get all factiva articles for this table using the foreign key relationship
-        articles = FactivaArticle.query.filter_by(returns_table_id=table_id).all()
-        if not articles:
+        # Get the selected fields of all factiva articles linked to this table, in one query
+        # New columns follow the order of the selection, each field once
+        merge_fields = [field for field in dict.fromkeys(selected_columns) if field in MERGE_FIELDS]
+        articles = load_article_frame(table_id, ['publish_date'] + [
+            field for field in merge_fields if field != 'publish_date'])
+        if articles.empty:
             print(f"ERROR: No Factiva articles found for table ID {table_id}")
             return jsonify({"error": "No Factiva articles found for this table"}), 400
             
         print(f"Found {len(articles)} Factiva articles for table ID {table_id}")
         
-        # Phase 2: Date Matching - Create a lookup dictionary of articles by date
-        # This makes it efficient to find articles that match a specific date
-        articles_by_date = {}
-        for article in articles:
-            # Skip articles without publish dates
-            if not article.publish_date:
-                continue
-                
-            # Use only the date part (ignore time) for matching
-            article_date = article.publish_date.date()
-            if article_date not in articles_by_date:
-                articles_by_date[article_date] = []
-            articles_by_date[article_date].append(article)
-        
-        print(f"Indexed articles by {len(articles_by_date)} unique dates")
-        
-        # Track statistics for the merge operation
-        matches_made = 0
-        new_columns_created = []
-        
-        # Map each date cell to matching articles (if any)
-        # This is the core of the left join operation
-        date_cell_articles = {}  # Maps DateCell ID -> list of articles with matching dates
-        
-        # For each cell in the date column, find articles with matching publish date
-        for cell in date_column.cells:
-            if not isinstance(cell, DateCell) or not cell.value:
-                continue
-                
-            cell_date = cell.value.date()  # Get just the date part
-            
-            # LEFT JOIN: Find articles with matching publish date
-            if cell_date in articles_by_date:
-                date_cell_articles[cell.id] = articles_by_date[cell_date]
-                matches_made += 1
+        # Phase 2: Date Matching - LEFT JOIN the date column with the articles on the
+        # publish day, building each selected field's whole column at once.
+        # If multiple articles match a date the first one is used; rows with no match
+        # get an empty value to keep the factiva data aligned with the dates.
+        date_values = load_column(returns_table, date_column)['values']
+        merged_columns, matches_made = merge_articles_by_date(date_values, articles, merge_fields)
         
         print(f"Found {matches_made} date cells with matching articles")
         
-        # Phase 3: Column Creation - Create new columns with the selected article fields
-        for column_id in selected_columns:
-            # Skip invalid column types
-            if column_id not in ["headline", "author", "word_count", "publish_date", "source", "content_preview"]:
-                continue
-                
-            # Create a new text column for this field
-            new_column = TextColumn(
-                name=f"Factiva: {column_id.replace('_', ' ').title()}",
-                returns_table_id=table_id
-            )
-            db.session.add(new_column)
-            db.session.flush()  # Get the new column ID before creating cells
-            new_columns_created.append(new_column)
-            
-            print(f"Created new column: {new_column.name}")
-            
-            # Phase 4: Cell Creation - For each date cell, create a corresponding text cell
-            cell_count = 0
-            for date_cell in date_column.cells:
-                # LEFT JOIN: For dates with no matching articles, create empty cells
-                # This maintains alignment between the date column and factiva data
-                if date_cell.id not in date_cell_articles:
-                    empty_cell = TextCell(value="", column_id=new_column.id)
-                    db.session.add(empty_cell)
-                    continue
-                
-                # If multiple articles match this date, we use the first one
-                # In a more advanced implementation, you might want to include data from all matches
-                article = date_cell_articles[date_cell.id][0]
-                
-                # Extract the selected field from the article
-                if column_id == "headline":
-                    value = article.headline
-                elif column_id == "author":
-                    value = article.author
-                elif column_id == "word_count":
-                    value = str(article.word_count) if article.word_count else ""
-                elif column_id == "publish_date":
-                    value = article.publish_date.strftime("%Y-%m-%d") if article.publish_date else ""
-                elif column_id == "source":
-                    value = article.source
-                elif column_id == "content_preview":
-                    value = article.content[:100] + "..." if article.content and len(article.content) > 100 else article.content
-                else:
-                    value = ""
-                
-                # Create the new cell with the article data
-                new_cell = TextCell(
-                    value=value,
-                    column_id=new_column.id
+        new_columns_created = []
+        # New columns and their values are written in one write turn, up to the commit
+        with serialized_write():
+            # Phase 3: Column Creation - Create a new text column for each selected field
+            for column_id in merge_fields:
+                new_column = TextColumn(
+                    name=f"Factiva: {column_id.replace('_', ' ').title()}",
+                    returns_table_id=table_id
                 )
-                db.session.add(new_cell)
-                cell_count += 1
+                db.session.add(new_column)
+                new_columns_created.append(new_column)
+                print(f"Created new column: {new_column.name}")
+            db.session.flush()  # Get the new column IDs before writing their values
             
-            print(f"Added {cell_count} cells to column {new_column.name}")
-        
-        # Save all changes to the database
-        db.session.commit()
+            # Phase 4: Cell Creation - Write each whole column through the table's storage backend
+            for column_id, new_column in zip(merge_fields, new_columns_created):
+                values = merged_columns[column_id]
+                write_column_values(db.session.connection(), returns_table, new_column.id, 'text', values)
+                print(f"Added {len(values)} cells to column {new_column.name} "
+                      f"({sum(1 for value in values if value)} non-empty)")
+        
+            # Save all changes to the database
+            bump_table_version(returns_table.id, [
+                {'kind': 'column', 'column_id': column.id} for column in new_columns_created])
+            db.session.commit()
         
         print(f"MERGE SUCCESSFUL: Created {len(new_columns_created)} columns with {matches_made} matches")
         
@@ -539,8 +837,15 @@ def save_footnote():
         
         # Set the footnote
         try:
-            column.set_footnote(row_index, footnote_text)
-            db.session.commit()
+            # Footnotes are stored as one JSON dict per column, so read and write it within one write turn
+            with serialized_write():
+                db.session.refresh(column)
+                column.set_footnote(row_index, footnote_text)
+                bump_table_version(returns_table.id, [{
+                    'kind': 'footnote', 'column_id': column.id,
+                    'row': row_index - 1 if row_index > 0 else None,
+                    'value': {'footnote': footnote_text}}])
+                db.session.commit()
             print(f"Footnote saved successfully")
         except Exception as e:
             db.session.rollback()
@@ -290,29 +290,25 @@ function updateMergeButtonState() {
 function refreshReturnsTable() {
   if (!currentTableId) return;
   
+  // With chron_tables.js loaded, only the merged columns are fetched
+  if (window.syncReturnTable) {
+    window.syncReturnTable();
+    return;
+  }
+  
   // Same code as the table load in the select change event
-  fetch(`/get_table/${currentTableId}`)
+  fetch(`/get_table_columns/${currentTableId}`, { cache: 'no-cache' })
     .then(response => response.json())
     .then(data => {
       if(data.error) {
         console.error(data.error);
-        return;
-      }
-      
-      // Parse the HTML to extract the table data
-      const parser = new DOMParser();
-      const doc = parser.parseFromString(data.table_html, 'text/html');
-      const table = doc.querySelector('#returnsTable');
-      
-      if(!table) {
         document.getElementById('chronTableHead').innerHTML = '<tr><th colspan="100%">No data available in table</th></tr>';
         document.getElementById('chronTableBody').innerHTML = '<tr><td colspan="100%" class="text-center">Table not found</td></tr>';
         return;
       }
       
       // Extract column headers
-      const headerRow = table.querySelector('thead tr');
-      const headers = Array.from(headerRow.querySelectorAll('th')).map(th => th.textContent);
+      const headers = data.columns.map(col => col.name);
       
       // Create header row for our chronology table
       let headerHtml = '<tr>';
@@ -322,26 +318,27 @@ function refreshReturnsTable() {
       headerHtml += '</tr>';
       document.getElementById('chronTableHead').innerHTML = headerHtml;
       
-      // Extract data rows
-      const rows = Array.from(table.querySelectorAll('tbody tr'));
+      // Build the data rows from the typed column arrays
       let rowsHtml = '';
       
-      if (rows.length === 0) {
+      if (data.row_count === 0) {
         rowsHtml = '<tr><td colspan="' + headers.length + '" class="text-center">No data available</td></tr>';
       } else {
-        rows.forEach(row => {
-          const cells = Array.from(row.querySelectorAll('td'));
-          if(cells.length > 0) {
-            rowsHtml += '<tr>';
-            cells.forEach(cell => {
-              // Check for ACD attribute in date cells
-              const isAcd = cell.getAttribute('data-acd') === '1';
-              const cellClass = isAcd ? 'acd-cell' : '';
-              rowsHtml += `<td class="${cellClass}">${cell.textContent}</td>`;
-            });
-            rowsHtml += '</tr>';
-          }
-        });
+        for (let rowIdx = 0; rowIdx < data.row_count; rowIdx++) {
+          rowsHtml += '<tr>';
+          data.columns.forEach(col => {
+            // Check the ACD flag of date cells
+            const isAcd = col.acd && col.acd[rowIdx] === '1';
+            const cellClass = isAcd ? 'acd-cell' : '';
+            const value = col.values[rowIdx];
+            const text = col.kind === 'date' ? (value || '')
+              : value === null ? 'None'
+              : col.kind === 'number' && Number.isInteger(value) ? value.toFixed(1)
+              : String(value);
+            rowsHtml += `<td class="${cellClass}">${text}</td>`;
+          });
+          rowsHtml += '</tr>';
+        }
       }
       
       document.getElementById('chronTableBody').innerHTML = rowsHtml;
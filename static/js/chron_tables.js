@@ -49,6 +49,30 @@ document.addEventListener('DOMContentLoaded', function() {
   }
 });
 
+// Columns already downloaded for the loaded returns table, keyed by column id,
+// and the table version they reflect
+let loadedColumnsTableId = null;
+let loadedColumnsById = {};
+let loadedTableVersion = null;
+
+// How often the loaded table checks the server for changes made elsewhere
+const TABLE_SYNC_INTERVAL_MS = 10000;
+
+// Fetch typed column arrays for a returns table, optionally only some column ids.
+// 'no-cache' revalidates the browser's copy by ETag, so an unchanged table costs a 304.
+function fetchTableColumns(tableId, columnIds) {
+  const query = columnIds ? `?columns=${columnIds.join(',')}` : '';
+  return fetch(`/get_table_columns/${tableId}${query}`, { cache: 'no-cache' }).then(response => response.json());
+}
+
+// Display text of a column value, matching the server-rendered returns table
+function formatColumnValue(kind, value) {
+  if (kind === 'date') return value || '';
+  if (value === null) return 'None';
+  if (kind === 'number' && Number.isInteger(value)) return value.toFixed(1);
+  return String(value);
+}
+
 // Load data into the returns table only
 function loadReturnTable(tableId) {
   if (!tableId) {
@@ -56,82 +80,27 @@ function loadReturnTable(tableId) {
     return;
   }
 
-  fetch(`/get_table/${tableId}`)
-    .then(response => response.json())
+  // Reloading the same table (e.g. after a merge added columns) only applies what changed
+  if (tableId === loadedColumnsTableId && loadedTableVersion !== null) {
+    syncReturnTable();
+    return;
+  }
+
+  fetchTableColumns(tableId)
     .then(data => {
       if(data.error) {
         console.error(data.error);
         clearReturnTable();
         return;
       }
-      
-      // Parse the HTML to extract the table data
-      const parser = new DOMParser();
-      const doc = parser.parseFromString(data.table_html, 'text/html');
-      const table = doc.querySelector('#returnsTable');
-      
-      if(!table) {
-        clearReturnTable();
-        return;
-      }
-      
-      // Extract column headers and data
-      const headerRow = table.querySelector('thead tr');
-      const headers = Array.from(headerRow.querySelectorAll('th')).map(th => th.textContent);
-      
-      // Create header row for our returns table
-      let headerHtml = '<tr>';
-      headers.forEach((header, idx) => {
-        headerHtml += `<th class="column-header" data-column-index="${idx}">${header}</th>`;
+
+      loadedColumnsTableId = tableId;
+      loadedTableVersion = data.version;
+      loadedColumnsById = {};
+      data.columns.forEach(col => {
+        loadedColumnsById[col.id] = col;
       });
-      headerHtml += '</tr>';
-      document.getElementById('chronTableHead').innerHTML = headerHtml;
-      
-      // Extract data rows
-      const rows = Array.from(table.querySelectorAll('tbody tr'));
-      let rowsHtml = '';
-      
-      if (rows.length === 0) {
-        rowsHtml = '<tr><td colspan="' + headers.length + '" class="text-center">No data available</td></tr>';
-      } else {
-        // Extract the data into our column arrays
-        returnTableColumns = headers.map((header, idx) => {
-          return {
-            name: header,
-            index: idx,
-            data: []
-          };
-        });
-
-        rows.forEach(row => {
-          const cells = Array.from(row.querySelectorAll('td'));
-          rowsHtml += '<tr>';
-          
-          cells.forEach((cell, idx) => {
-            // Store the data in our column objects
-            if (idx < returnTableColumns.length) {
-              returnTableColumns[idx].data.push(cell.textContent);
-            }
-            
-            // Check for ACD attribute in date cells
-            const isAcd = cell.getAttribute('data-acd') === '1';
-            const cellClass = isAcd ? 'acd-cell' : '';
-            rowsHtml += `<td class="${cellClass}">${cell.textContent}</td>`;
-          });
-          
-          rowsHtml += '</tr>';
-        });
-      }
-      
-      document.getElementById('chronTableBody').innerHTML = rowsHtml;
-      
-      // Update export button states only
-      const hasData = rows.length > 0;
-      const hasChronColumns = chronTableColumns.length > 0;
-      document.getElementById('exportToExcel').disabled = !hasData || !hasChronColumns;
-      document.getElementById('exportToStyledExcel').disabled = !hasData || !hasChronColumns;
-      
-      console.log('Loaded returns table columns:', returnTableColumns.length);
+      renderReturnTable();
       
       // Also make sure factiva articles are loaded
       if (window.loadFactivaArticles) {
@@ -147,6 +116,105 @@ function loadReturnTable(tableId) {
     });
 }
 
+// Bring the loaded returns table up to date with the changes made since it was loaded
+// (merged columns, ACD flags and footnotes, from this page or any other view)
+function syncReturnTable() {
+  const tableId = loadedColumnsTableId;
+  if (!tableId || loadedTableVersion === null) return Promise.resolve();
+
+  return fetch(`/get_table_changes/${tableId}?since=${loadedTableVersion}`)
+    .then(response => response.json())
+    .then(data => {
+      // Ignore answers for a table that is no longer loaded
+      if (data.error || tableId !== loadedColumnsTableId || data.version === loadedTableVersion) {
+        if (data.error) console.error(data.error);
+        return;
+      }
+      if (data.reset) {
+        // Too far behind to replay the changes: download the whole table again
+        loadedColumnsTableId = null;
+        loadReturnTable(tableId);
+        return;
+      }
+
+      data.columns.forEach(col => {
+        loadedColumnsById[col.id] = col;
+      });
+      data.changes.forEach(change => {
+        const col = loadedColumnsById[change.column_id];
+        if (change.kind === 'cell' && col && col.acd) {
+          const flag = change.value.acd === 1 ? '1' : '0';
+          col.acd = col.acd.slice(0, change.row) + flag + col.acd.slice(change.row + 1);
+        }
+      });
+      loadedTableVersion = data.version;
+      renderReturnTable();
+
+      // Reattach the header listeners and reload the footnotes, which may have changed too
+      setTimeout(initFootnoteSystem, 300);
+    })
+    .catch(error => {
+      console.error('Error syncing table changes:', error);
+    });
+}
+
+// Render the returns table from the loaded columns
+function renderReturnTable() {
+  const columns = Object.values(loadedColumnsById).sort((a, b) => a.id - b.id);
+  const headers = columns.map(col => col.name);
+  
+  // Create header row for our returns table
+  let headerHtml = '<tr>';
+  headers.forEach((header, idx) => {
+    headerHtml += `<th class="column-header" data-column-index="${idx}">${header}</th>`;
+  });
+  headerHtml += '</tr>';
+  document.getElementById('chronTableHead').innerHTML = headerHtml;
+  
+  // Build the column arrays and the data rows straight from the typed columns
+  const rowCount = columns.length > 0 ? columns[0].values.length : 0;
+  returnTableColumns = columns.map((col, idx) => {
+    return {
+      name: col.name,
+      index: idx,
+      data: col.values.map(value => formatColumnValue(col.kind, value))
+    };
+  });
+
+  const rowsHtml = [];
+  if (rowCount === 0) {
+    rowsHtml.push('<tr><td colspan="' + headers.length + '" class="text-center">No data available</td></tr>');
+  } else {
+    for (let rowIdx = 0; rowIdx < rowCount; rowIdx++) {
+      rowsHtml.push('<tr>');
+      columns.forEach((col, idx) => {
+        // Highlight date cells flagged as ACD
+        const cellClass = col.acd && col.acd[rowIdx] === '1' ? 'acd-cell' : '';
+        rowsHtml.push(`<td class="${cellClass}">${returnTableColumns[idx].data[rowIdx]}</td>`);
+      });
+      rowsHtml.push('</tr>');
+    }
+  }
+  
+  document.getElementById('chronTableBody').innerHTML = rowsHtml.join('');
+  
+  // Update export button states only
+  const hasData = rowCount > 0;
+  const hasChronColumns = chronTableColumns.length > 0;
+  document.getElementById('exportToExcel').disabled = !hasData || !hasChronColumns;
+  document.getElementById('exportToStyledExcel').disabled = !hasData || !hasChronColumns;
+  
+  console.log('Loaded returns table columns:', returnTableColumns.length);
+}
+
+// Pick up changes made in other views while this page is open
+setInterval(() => {
+  if (!document.hidden) syncReturnTable();
+}, TABLE_SYNC_INTERVAL_MS);
+document.addEventListener('visibilitychange', () => {
+  if (!document.hidden) syncReturnTable();
+});
+
 // Add a column from returns table to the chron table
 function addColumnToChronTable(columnIndex) {
   if (columnIndex < 0 || columnIndex >= returnTableColumns.length) {
@@ -319,6 +387,9 @@ function clearReturnTable() {
   document.getElementById('exportToExcel').disabled = true;
   document.getElementById('exportToStyledExcel').disabled = true;
   returnTableColumns = [];
+  loadedColumnsTableId = null;
+  loadedColumnsById = {};
+  loadedTableVersion = null;
 }
 
 // Clear the chron table
@@ -454,3 +525,4 @@ function exportChronTableToStyledExcel() {
 window.removeColumnFromChron = removeColumnFromChron;
 window.addColumnToChronTable = addColumnToChronTable; 
 window.reorderChronColumns = reorderChronColumns;
+window.syncReturnTable = syncReturnTable;
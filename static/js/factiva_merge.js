@@ -241,7 +241,13 @@ function performMerge() {
 function refreshChronTable() {
   console.log('Refreshing chronology table');
   
-  // The simplest way is to trigger the change event on the table selector
+  // Fetch only the merged columns, keeping the chron table as it is
+  if (window.syncReturnTable) {
+    window.syncReturnTable();
+    return;
+  }
+  
+  // Otherwise trigger the change event on the table selector
   const tableSelect = document.getElementById('returnsTableSelectChron');
   if (tableSelect) {
     const event = new Event('change');
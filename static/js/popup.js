@@ -50,12 +50,19 @@ function cellClickHandler(event) {
   if (this.dataset.cellType === "date") {
     const acdCheckbox = document.getElementById("acdCheckbox");
     const cellId = this.dataset.cellId;
+    // Blob-stored tables address date cells by column and row instead of a cell id
+    const cellRef = cellId !== undefined
+      ? {cell_id: cellId}
+      : {column_id: this.dataset.columnId, row: this.dataset.row};
+    const cellSelector = cellId !== undefined
+      ? `td[data-cell-id="${cellId}"]`
+      : `td[data-column-id="${cellRef.column_id}"][data-row="${cellRef.row}"]`;
     acdCheckbox.addEventListener("change", function() {
       const newValue = acdCheckbox.checked ? 1 : 0;
       fetch("/update_datecell_acd", {
         method: "POST",
         headers: {"Content-Type": "application/json"},
-        body: JSON.stringify({cell_id: cellId, acd: newValue})
+        body: JSON.stringify({...cellRef, acd: newValue})
       })
       .then(response => response.json())
       .then(data => {
@@ -63,7 +70,7 @@ function cellClickHandler(event) {
           console.error(data.error);
         } else {
           // Update the cell's dataset
-          const cell = document.querySelector(`td[data-cell-id="${cellId}"]`);
+          const cell = document.querySelector(cellSelector);
           if(cell) {
             cell.dataset.acd = newValue;
             // Update row style inline for immediate feedback
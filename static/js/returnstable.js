@@ -1,3 +1,6 @@
+// How often the displayed table checks the server for changes made elsewhere
+const TABLE_SYNC_INTERVAL_MS = 10000;
+
 // Wait for the document to be fully loaded before initializing
 $(document).ready(function() {
   const savedTableId = localStorage.getItem('selectedReturnsTable');
@@ -5,7 +8,7 @@ $(document).ready(function() {
   // Only proceed if there's a saved table id and it's not the "upload" flag.
   if (savedTableId && savedTableId !== "upload") {
     // Try fetching the table data
-    fetch(`/get_table/${savedTableId}`)
+    fetch(`/get_table/${savedTableId}?server_side=1`, { cache: 'no-cache' })
       .then(response => {
         // If the table does not exist, clean up the localStorage entry.
         if (!response.ok) {
@@ -34,10 +37,14 @@ $(document).ready(function() {
 });
 
 /**
- * Initializes the DataTable plugin with custom options
+ * Initializes the DataTable plugin with custom options.
+ * Tables rendered with only a header (data-server-side) fetch their rows page by page
+ * from /get_table_rows, which sorts, searches and slices them in the database.
  */
 function initDataTable() {
-  $('#returnsTable').DataTable({
+  const tableEl = document.getElementById('returnsTable');
+  const serverSide = tableEl && tableEl.dataset.serverSide === 'true';
+  const options = {
     destroy: true,
     paging: false,            // One page only
     scrollY: "1200px",        // Set ReturnsTable height
@@ -49,6 +56,12 @@ function initDataTable() {
     buttons: ['copy', 'csv', 'excel', 'print'],
     info: false, // Hide default info
     rowCallback: function(row, data, index) {
+      // Server-side rows carry the date cell attributes the ACD popup reads
+      if (data.date_cells) {
+        Object.entries(data.date_cells).forEach(([columnIndex, attributes]) => {
+          $('td', row).eq(columnIndex).attr(attributes);
+        });
+      }
       if ($(row).find("td[data-acd='1']").length > 0) {
         $(row).addClass('acd-row');
       }
@@ -65,7 +78,23 @@ function initDataTable() {
         window.attachPopupListeners();
       }      
     }
-  });
+  };
+
+  if (serverSide) {
+    Object.assign(options, {
+      serverSide: true,
+      processing: true,
+      paging: true,
+      pageLength: 100,
+      searchDelay: 400,
+      info: true,
+      order: [],              // Keep the file order until a column is sorted
+      ajax: { url: `/get_table_rows/${tableEl.dataset.tableId}` },
+      columns: $('#returnsTable thead th').map(index => ({ data: String(index) })).get()
+    });
+  }
+
+  $('#returnsTable').DataTable(options);
 }
 
 function updateCustomFooter() {
@@ -73,6 +102,22 @@ function updateCustomFooter() {
   if (!footerEl) return; // No footer defined
   const tableEl = document.getElementById('returnsTable');
   const tableName = tableEl ? tableEl.dataset.tableName || "Returns" : "Returns";
+  const formatDate = function(date) {
+    const m = (date.getMonth() + 1).toString().padStart(2, '0');
+    const d = date.getDate().toString().padStart(2, '0');
+    return `${m}/${d}/${date.getFullYear()}`;
+  };
+  // Server-side tables only hold one page of rows; the server sends the date range instead
+  if (tableEl && tableEl.dataset.serverSide === 'true') {
+    if (tableEl.dataset.firstDate) {
+      const minDate = new Date(tableEl.dataset.firstDate + 'T00:00:00');
+      const maxDate = new Date(tableEl.dataset.lastDate + 'T00:00:00');
+      footerEl.innerText = `Showing ${tableName} returns from ${formatDate(minDate)} to ${formatDate(maxDate)}`;
+    } else {
+      footerEl.innerText = `Showing ${tableName} returns (no date data)`;
+    }
+    return;
+  }
   let dates = [];
   $('#returnsTable tbody tr').each(function() {
     const cellText = $(this).find('td[data-cell-type="date"]').first().text();
@@ -86,11 +131,6 @@ function updateCustomFooter() {
   if (dates.length > 0) {
     const minDate = new Date(Math.min(...dates));
     const maxDate = new Date(Math.max(...dates));
-    const formatDate = function(date) {
-      const m = (date.getMonth() + 1).toString().padStart(2, '0');
-      const d = date.getDate().toString().padStart(2, '0');
-      return `${m}/${d}/${date.getFullYear()}`;
-    };
     footerEl.innerText = `Showing ${tableName} returns from ${formatDate(minDate)} to ${formatDate(maxDate)}`;
   } else {
     footerEl.innerText = `Showing ${tableName} returns (no date data)`;
@@ -123,18 +163,57 @@ function attachEventListeners() {
         .catch(e => console.error('Delete error:', e));
     } else if (tableId) {
       // Fetch and display selected table data
-      fetch(`/get_table/${tableId}`)
-        .then(response => response.json())
-        .then(data => {
-          const container = document.querySelector('.table-container') || createTableContainer();
-          container.innerHTML = data.table_html;
-          initDataTable();
-        })
-        .catch(error => console.error('Error:', error));
+      loadServerSideTable(tableId);
     }
   });
 }
 
+// Fetch a table's header and let DataTables page through its rows
+function loadServerSideTable(tableId) {
+  fetch(`/get_table/${tableId}?server_side=1`, { cache: 'no-cache' })
+    .then(response => response.json())
+    .then(data => {
+      const container = document.querySelector('.table-container') || createTableContainer();
+      container.innerHTML = data.table_html;
+      initDataTable();
+    })
+    .catch(error => console.error('Error:', error));
+}
+
+// Check whether the displayed table changed since it was loaded (an ACD flag set here
+// or on another page, columns merged on the chronology page) and refresh it if so
+function syncDisplayedTable() {
+  const tableEl = document.getElementById('returnsTable');
+  if (!tableEl || tableEl.dataset.serverSide !== 'true' || !tableEl.dataset.version) return;
+  const tableId = tableEl.dataset.tableId;
+
+  fetch(`/get_table_changes/${tableId}?since=${tableEl.dataset.version}`)
+    .then(response => response.json())
+    .then(data => {
+      if (data.error) {
+        console.error(data.error);
+        return;
+      }
+      if (String(data.version) === tableEl.dataset.version) return;
+      if (data.reset || data.columns.length > 0) {
+        // New columns change the DataTables layout, so load the header again
+        loadServerSideTable(tableId);
+        return;
+      }
+      tableEl.dataset.version = data.version;
+      // Redraw the current page from the server, keeping its paging, sorting and search
+      $('#returnsTable').DataTable().draw(false);
+    })
+    .catch(error => console.error('Error syncing table changes:', error));
+}
+
+setInterval(() => {
+  if (!document.hidden) syncDisplayedTable();
+}, TABLE_SYNC_INTERVAL_MS);
+document.addEventListener('visibilitychange', () => {
+  if (!document.hidden) syncDisplayedTable();
+});
+
 function updateDropdownOptions(tables) {
   const dropdown = document.getElementById('returnsTableSelect');
   // Store the current selection
@@ -183,8 +262,8 @@ function fileUploadHandler(e) {
     const formData = new FormData();
     formData.append('file', this.files[0]);
     
-    // Send file to server for processing
-    fetch('/', {
+    // Queue the file for background ingestion, then poll the job until it finishes
+    fetch('/upload_jobs', {
       method: 'POST',
       body: formData
     })
@@ -195,20 +274,8 @@ function fileUploadHandler(e) {
         alert(data.error);
         return;
       }
-      // Update table content and dropdown
-      const container = document.querySelector('.table-container') || createTableContainer();
-      container.innerHTML = data.table_html;
-      updateDropdownOptions(data.tables);
-      if (data.selected_table_id) {
-        localStorage.setItem('selectedReturnsTable', data.selected_table_id);
-        document.getElementById('returnsTableSelect').value = data.selected_table_id;
-      }
-      const debugInfo = document.getElementById('debugDropdown');
-      if (debugInfo && data.debug_info_html) {
-        debugInfo.innerHTML = data.debug_info_html;
-      }
-      // Initialize DataTable
-      initDataTable();
+      showUploadStatus('Upload queued...');
+      pollUploadJob(data.job_id);
     })
     .catch(error => {
       console.error('Error:', error);
@@ -217,5 +284,50 @@ function fileUploadHandler(e) {
   }
 }
 
+// Poll an upload job's status until it is done or failed
+function pollUploadJob(jobId) {
+  fetch(`/upload_jobs/${jobId}`)
+    .then(response => response.json())
+    .then(job => {
+      if (job.error && job.status !== 'failed') {
+        console.error('Upload job error:', job.error);
+        showUploadStatus('');
+        return;
+      }
+      if (job.status === 'failed') {
+        showUploadStatus('');
+        alert('Error uploading file: ' + job.error);
+        return;
+      }
+      if (job.status !== 'done') {
+        showUploadStatus(`Uploading ${job.filename}: ${job.phase} (${job.rows_ingested} rows ingested)`);
+        setTimeout(() => pollUploadJob(jobId), 1000);
+        return;
+      }
+
+      // Job finished: refresh the dropdown and load the new table
+      showUploadStatus('');
+      updateDropdownOptions(job.tables);
+      localStorage.setItem('selectedReturnsTable', job.table_id);
+      document.getElementById('returnsTableSelect').value = job.table_id;
+      loadServerSideTable(job.table_id);
+    })
+    .catch(error => {
+      console.error('Error polling upload job:', error);
+      showUploadStatus('');
+    });
+}
+
+// Show upload progress in the custom footer
+function showUploadStatus(message) {
+  const footerEl = document.getElementById('customFooter');
+  if (!footerEl) return;
+  if (message) {
+    footerEl.innerText = message;
+  } else {
+    updateCustomFooter();
+  }
+}
+
 // Initial call to set up event listeners
 attachEventListeners();
\ No newline at end of file
@@ -0,0 +1,201 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import current_app, request, stream_with_context
+from sqlalchemy import insert, select, update
+from models import db, ReturnsTable, TableChange
+
+# Rendered payloads kept in memory by default; a 200k-row table renders to ~30 MB of HTML
+DEFAULT_RENDER_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Clients further behind than this many versions reload the whole table instead
+MAX_SYNC_VERSIONS = 1000
+
+class RenderCache:
+    """Least-recently-used cache of rendered table payloads, bounded by their total size.
+
+    Keys are (table_id, version, variant) tuples. A change to a table bumps its version,
+    so stale payloads are never looked up again and simply age out.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_RENDER_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    @property
+    def max_entry_bytes(self):
+        """Largest payload worth keeping; a bigger one would evict most of the cache."""
+        return self.max_bytes // 4
+
+    def put(self, key, body):
+        if len(body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key))
+            self._entries[key] = body
+            self.size += len(body)
+            self._evict()
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            _, body = self._entries.popitem(last=False)
+            self.size -= len(body)
+
+render_cache = RenderCache()
+
+def bump_table_version(table_id, changes=None):
+    """Increment a table's version and log what changed, in the current transaction.
+
+    Call it next to every change to a table's columns, cells, ACD flags or footnotes,
+    before the commit, so cached payloads and client ETags of the old version are dropped
+    and clients holding the old version can catch up through load_table_changes.
+
+    Args:
+        table_id: ID of the ReturnsTable.
+        changes: List of dicts with 'kind' and optionally 'column_id', 'row' and 'value'
+            (see TableChange). None logs a 'table' change, telling clients to reload.
+
+    Returns:
+        int: The new version.
+    """
+    db.session.execute(update(ReturnsTable)
+                       .where(ReturnsTable.id == table_id)
+                       .values(version=ReturnsTable.version + 1))
+    version = db.session.execute(select(ReturnsTable.version)
+                                 .where(ReturnsTable.id == table_id)).scalar_one()
+    db.session.execute(insert(TableChange), [{
+        'returns_table_id': table_id,
+        'version': version,
+        'kind': change['kind'],
+        'column_id': change.get('column_id'),
+        'row': change.get('row'),
+        'value': change.get('value')
+    } for change in changes or [{'kind': 'table'}]])
+    return version
+
+def load_table_changes(table_id, since, version):
+    """Return the changes that took a table from version `since` to `version`.
+
+    Returns:
+        list: TableChange rows ordered as they were made, or None if the log doesn't
+            cover every version in between and the client has to reload the table.
+    """
+    if since > version or version - since > MAX_SYNC_VERSIONS:
+        return None
+    changes = (TableChange.query
+               .filter(TableChange.returns_table_id == table_id,
+                       TableChange.version > since,
+                       TableChange.version <= version)
+               .order_by(TableChange.version, TableChange.id)
+               .all())
+    # Versions bumped before the log existed have no entries
+    if len({change.version for change in changes}) < version - since:
+        return None
+    if any(change.kind == 'table' for change in changes):
+        return None
+    return changes
+
+def get_table_version(table_id):
+    """Return (version, upload_time) of a table, or None if it doesn't exist."""
+    return db.session.execute(select(ReturnsTable.version, ReturnsTable.upload_time)
+                              .where(ReturnsTable.id == table_id)).first()
+
+def cached_table_response(table_id, variant, render):
+    """Serve a rendered table payload from the cache, or a 304 if the client already has it.
+
+    Args:
+        table_id: ID of the ReturnsTable.
+        variant: String naming the payload and every option it depends on, e.g. 'html'.
+        render: Callable building the JSON-serializable payload on a cache miss.
+
+    Returns:
+        Response: JSON response carrying an ETag, or None if the table doesn't exist.
+    """
+    def render_body(key):
+        body = current_app.json.dumps(render()).encode()
+        render_cache.put(key, body)
+        return body
+
+    return _table_response(table_id, variant, render_body)
+
+def streamed_table_response(table_id, variant, render_chunks):
+    """Like cached_table_response, but a cache miss is streamed to the client as it renders.
+
+    Args:
+        table_id: ID of the ReturnsTable.
+        variant: String naming the payload and every option it depends on.
+        render_chunks: Callable returning an iterator of str chunks that together form
+            the JSON body. It runs while the response is sent, inside the request context.
+
+    Returns:
+        Response: Streamed JSON response carrying an ETag, or None if the table doesn't exist.
+    """
+    def stream_body(key):
+        return stream_with_context(_stream_and_cache(key, render_chunks))
+
+    return _table_response(table_id, variant, stream_body)
+
+def _table_response(table_id, variant, build_body):
+    row = get_table_version(table_id)
+    if row is None:
+        return None
+    version, upload_time = row
+
+    # Table ids can be reused after a database reset, so the upload time is part of the ETag
+    etag = hashlib.sha1(f"{table_id}:{version}:{upload_time}:{variant}".encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        key = (table_id, version, variant)
+        body = render_cache.get(key)
+        if body is None:
+            body = build_body(key)
+        response = current_app.response_class(body, mimetype='application/json')
+
+    response.set_etag(etag)
+    # Let browsers keep the payload but check the ETag before every reuse
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _stream_and_cache(key, render_chunks):
+    """Yield the encoded chunks, keeping a copy for the cache while the payload stays small."""
+    table_id, version, _ = key
+    kept = []
+    size = 0
+    for chunk in render_chunks():
+        data = chunk.encode()
+        yield data
+        if kept is not None:
+            size += len(data)
+            if size <= render_cache.max_entry_bytes:
+                kept.append(data)
+            else:
+                kept = None
+    # Rows are read in several statements; only cache the payload if no write landed in between
+    if kept is not None and get_table_version(table_id)[0] == version:
+        render_cache.put(key, b"".join(kept))
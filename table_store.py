@@ -0,0 +1,464 @@
+import zlib
+import numpy as np
+import pandas as pd
+from sqlalchemy import String, Text, case, cast, func, select, union
+from sqlalchemy.orm import joinedload
+from models import (db, ReturnsTable, Column, ColumnBlob, BaseCell, NumberCell, DateCell, TextCell,
+                    FactivaArticle, ReturnsTableArticle)
+
+# Storage backends a ReturnsTable can use
+STORAGE_BACKENDS = ('cells', 'blob')
+
+# Column discriminator -> cell kind stored in it
+COLUMN_KINDS = {
+    'datecolumn': 'date',
+    'textcolumn': 'text',
+    'column': 'number',
+}
+
+# Cell kind -> child cell model holding its values
+CELL_MODELS = {
+    'date': DateCell,
+    'number': NumberCell,
+    'text': TextCell,
+}
+
+# Characters of article content in a content_preview
+ARTICLE_PREVIEW_CHARS = 100
+
+# Article fields the listing routes can return -> SQL expression reading them; the
+# preview is cut in SQL, so listings never transfer whole articles
+ARTICLE_FIELDS = {
+    'id': FactivaArticle.id,
+    'headline': FactivaArticle.headline,
+    'author': FactivaArticle.author,
+    'word_count': FactivaArticle.word_count,
+    'publish_date': FactivaArticle.publish_date,
+    'source': FactivaArticle.source,
+    'content_preview': case(
+        (func.length(FactivaArticle.content) > ARTICLE_PREVIEW_CHARS,
+         func.substr(FactivaArticle.content, 1, ARTICLE_PREVIEW_CHARS, type_=Text) + '...'),
+        else_=FactivaArticle.content),
+}
+
+def encode_column(kind, values):
+    """Encode converted column values as compressed (values, null_mask) bytes.
+
+    Args:
+        kind: Cell kind ('date', 'number' or 'text').
+        values: List of values as produced by ingest.convert_column_values (None = missing).
+
+    Returns:
+        tuple: (values_bytes, null_mask_bytes), both zlib-compressed.
+    """
+    nulls = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+    if kind == 'number':
+        payload = np.array(values, dtype='<f8').tobytes()
+    elif kind == 'date':
+        dates = pd.to_datetime(pd.Series(values, dtype=object)).to_numpy(dtype='datetime64[ns]')
+        payload = dates.view('<i8').tobytes()
+    else:
+        encoded = [b'' if value is None else value.encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+        np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        payload = offsets.tobytes() + b''.join(encoded)
+    return zlib.compress(payload), zlib.compress(np.packbits(nulls).tobytes())
+
+def decode_column(blob):
+    """Decode a ColumnBlob into a list of Python values (None = missing)."""
+    nulls = np.unpackbits(np.frombuffer(zlib.decompress(blob.null_mask), dtype=np.uint8),
+                          count=blob.length).astype(bool)
+    payload = zlib.decompress(blob.values)
+    if blob.kind == 'number':
+        values = np.frombuffer(payload, dtype='<f8').tolist()
+    elif blob.kind == 'date':
+        stamps = np.frombuffer(payload, dtype='<i8', count=blob.length).view('datetime64[ns]')
+        values = list(pd.DatetimeIndex(stamps).to_pydatetime())
+    else:
+        offsets = np.frombuffer(payload, dtype='<i8', count=blob.length + 1)
+        text = payload[offsets.nbytes:]
+        values = [text[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+    return [None if missing else value for value, missing in zip(values, nulls)]
+
+def encode_acd(acd_values):
+    """Encode a list of 0/1 ACD flags as compressed bytes."""
+    return zlib.compress(np.asarray(acd_values, dtype=np.int8).tobytes())
+
+def decode_acd(blob):
+    """Decode a ColumnBlob's ACD flags into a list of ints (all 0 when never set)."""
+    if blob.acd is None:
+        return [0] * blob.length
+    return np.frombuffer(zlib.decompress(blob.acd), dtype=np.int8).tolist()
+
+def store_column_blob(connection, returns_table_id, column_id, kind, values):
+    """Write a whole column as a single column_blobs row.
+
+    Args:
+        connection: SQLAlchemy connection taking part in the current transaction.
+        returns_table_id: ID of the ReturnsTable the column belongs to.
+        column_id: ID of the Column.
+        kind: Cell kind ('date', 'number' or 'text').
+        values: List of converted values (None = missing).
+
+    Returns:
+        int: Number of values stored.
+    """
+    encoded_values, null_mask = encode_column(kind, values)
+    connection.execute(ColumnBlob.__table__.insert(), {
+        'column_id': column_id,
+        'returns_table_id': returns_table_id,
+        'kind': kind,
+        'length': len(values),
+        'values': encoded_values,
+        'null_mask': null_mask,
+        'acd': encode_acd([0] * len(values)) if kind == 'date' else None
+    })
+    return len(values)
+
+def set_blob_acd(column_id, row, acd_value):
+    """Set the ACD flag of one row in a blob-stored date column.
+
+    Returns:
+        int: The stored flag, or None if the column has no blob or the row is out of range.
+    """
+    blob = db.session.get(ColumnBlob, column_id)
+    if blob is None or blob.kind != 'date' or not 0 <= row < blob.length:
+        return None
+    flags = decode_acd(blob)
+    flags[row] = int(acd_value)
+    blob.acd = encode_acd(flags)
+    return flags[row]
+
+def get_returns_table(table_id):
+    """Fetch a ReturnsTable and its columns in a single query; None if it doesn't exist."""
+    return db.session.get(ReturnsTable, table_id, options=[joinedload(ReturnsTable.columns)])
+
+def load_cell_rows(columns, start=0, stop=None, positions=None):
+    """Fetch the cells of several columns for rows [start, stop), aligned by row_position.
+
+    Uses one query per cell kind, each an indexed lookup on (column_id, row_position),
+    instead of loading the Column.cells relationships.
+
+    Args:
+        columns: List of (column_id, kind) tuples.
+        start: First row_position to fetch.
+        stop: Row position to stop before; None fetches to the end of the columns.
+        positions: Optional list of row_positions to fetch instead of a range; the
+            returned lists then follow the order of `positions`.
+
+    Returns:
+        dict: column_id -> {'values': [...], 'cell_ids': [...], 'acd': [...] or None},
+            each list holding one entry per row from `start` (or per entry of
+            `positions`); rows without a cell are None.
+    """
+    column_ids_by_kind = {}
+    for column_id, kind in columns:
+        column_ids_by_kind.setdefault(kind, []).append(column_id)
+
+    base_table = BaseCell.__table__
+    fetched = []
+    for kind, column_ids in column_ids_by_kind.items():
+        child_table = CELL_MODELS[kind].__table__
+        fields = [base_table.c.column_id, base_table.c.row_position, base_table.c.id, child_table.c.value]
+        if kind == 'date':
+            fields.append(child_table.c.acd)
+        query = (select(*fields)
+                 .join_from(base_table, child_table, base_table.c.id == child_table.c.id)
+                 .where(base_table.c.column_id.in_(column_ids)))
+        if positions is not None:
+            query = query.where(base_table.c.row_position.in_(positions))
+        if start:
+            query = query.where(base_table.c.row_position >= start)
+        if stop is not None:
+            query = query.where(base_table.c.row_position < stop)
+        fetched.append((kind, db.session.execute(query).all()))
+
+    if positions is not None:
+        index_of = {position: index for index, position in enumerate(positions)}
+        num_rows = len(positions)
+    else:
+        index_of = None
+        num_rows = 0
+        for _, rows in fetched:
+            for row in rows:
+                num_rows = max(num_rows, row.row_position - start + 1)
+
+    aligned = {}
+    for column_id, kind in columns:
+        aligned[column_id] = {
+            'values': [None] * num_rows,
+            'cell_ids': [None] * num_rows,
+            'acd': [0] * num_rows if kind == 'date' else None
+        }
+    for kind, rows in fetched:
+        for row in rows:
+            position = index_of[row.row_position] if index_of is not None else row.row_position - start
+            column = aligned[row.column_id]
+            column['values'][position] = row.value
+            column['cell_ids'][position] = row.id
+            if kind == 'date':
+                column['acd'][position] = row.acd
+    return aligned
+
+def load_row_range(returns_table, start, stop, column_ids=None):
+    """Load rows [start, stop) of a ReturnsTable, optionally only some of its columns.
+
+    Returns:
+        list: Column dicts shaped like load_table_columns' items, holding only those rows.
+    """
+    columns = sorted(returns_table.columns, key=lambda c: c.id)
+    if column_ids is not None:
+        wanted = set(column_ids)
+        columns = [column for column in columns if column.id in wanted]
+
+    if returns_table.storage == 'blob':
+        loaded = [load_column(returns_table, column) for column in columns]
+        for column in loaded:
+            column['values'] = column['values'][start:stop]
+            if column['acd'] is not None:
+                column['acd'] = column['acd'][start:stop]
+        return loaded
+
+    kinds = [(column.id, COLUMN_KINDS.get(column.discriminator, 'text')) for column in columns]
+    aligned = load_cell_rows(kinds, start, stop)
+    return [
+        {'id': column.id, 'name': column.name, 'kind': kind, 'column': column, **aligned[column.id]}
+        for column, (_, kind) in zip(columns, kinds)
+    ]
+
+def load_row(returns_table, row, column_ids=None):
+    """Load a single row of a ReturnsTable; see load_row_range."""
+    return load_row_range(returns_table, row, row + 1, column_ids)
+
+def load_table_columns(returns_table, column_ids=None):
+    """Load every column of a ReturnsTable (or only `column_ids`) with its values, whichever backend stores it.
+
+    Blob tables are read with a single query joining columns to column_blobs; cell
+    tables with one indexed query per cell kind, aligned by row_position. The number of
+    queries does not depend on the number of rows or columns; together with
+    get_returns_table a table view costs at most 1 + len(CELL_MODELS) queries.
+
+    Returns:
+        list: One dict per column, ordered by column id, with keys
+            - id, name, kind ('date', 'number' or 'text') and column (the Column model)
+            - values: list of cell values, None for missing
+            - cell_ids: list of cell ids (None for blob tables)
+            - acd: list of ACD flags for date columns, otherwise None
+    """
+    if returns_table.storage == 'blob':
+        columns = []
+        query = (db.session.query(Column, ColumnBlob)
+                 .join(ColumnBlob, ColumnBlob.column_id == Column.id)
+                 .filter(Column.returns_table_id == returns_table.id))
+        if column_ids is not None:
+            query = query.filter(Column.id.in_(column_ids))
+        rows = query.order_by(Column.id).all()
+        for column, blob in rows:
+            columns.append({
+                'id': column.id,
+                'name': column.name,
+                'kind': blob.kind,
+                'column': column,
+                'values': decode_column(blob),
+                'cell_ids': None,
+                'acd': decode_acd(blob) if blob.kind == 'date' else None
+            })
+        return columns
+
+    return load_row_range(returns_table, 0, None, column_ids=column_ids)
+
+def load_column(returns_table, column):
+    """Load a single column of a ReturnsTable; returns a dict shaped like load_table_columns' items."""
+    if returns_table.storage == 'blob':
+        blob = column.blob
+        return {
+            'id': column.id,
+            'name': column.name,
+            'kind': blob.kind,
+            'column': column,
+            'values': decode_column(blob),
+            'cell_ids': None,
+            'acd': decode_acd(blob) if blob.kind == 'date' else None
+        }
+
+    return load_row_range(returns_table, 0, None, column_ids=[column.id])[0]
+
+def format_cell_value(kind, value):
+    """Return the text a cell value is displayed with in the returns table."""
+    if kind == 'date':
+        return value.strftime('%Y-%m-%d') if value else ''
+    return f"{value}"
+
+def load_date_range(returns_table):
+    """Return the (earliest, latest) value of the table's first date column, or (None, None)."""
+    date_column = next((column for column in sorted(returns_table.columns, key=lambda c: c.id)
+                        if COLUMN_KINDS.get(column.discriminator) == 'date'), None)
+    if date_column is None:
+        return None, None
+    if returns_table.storage == 'blob':
+        values = [value for value in load_column(returns_table, date_column)['values'] if value is not None]
+        return (min(values), max(values)) if values else (None, None)
+
+    base_table = BaseCell.__table__
+    date_table = DateCell.__table__
+    return tuple(db.session.execute(
+        select(func.min(date_table.c.value), func.max(date_table.c.value))
+        .join_from(base_table, date_table, base_table.c.id == date_table.c.id)
+        .where(base_table.c.column_id == date_column.id)
+    ).one())
+
+def load_row_window(returns_table, start=0, length=None, order_column_id=None, descending=False, search=None):
+    """Filter, sort and slice a table's rows, loading only the requested page.
+
+    Cell tables do the work in SQL: the search is a case-insensitive LIKE over each
+    cell's displayed text, the sort an ORDER BY on the chosen column's values (ties keep
+    the file order), and only the row_positions of the page are fetched before their
+    cells are loaded. Blob tables keep each column in one array, so they are decoded and
+    then filtered and sorted in memory.
+
+    Args:
+        returns_table: ReturnsTable to page through.
+        start: Index of the page's first row, after filtering and sorting.
+        length: Number of rows in the page; None returns every matching row.
+        order_column_id: ID of the column to sort by; None keeps the file order.
+        descending: Sort in descending order.
+        search: Text a row must contain in at least one of its cells.
+
+    Returns:
+        tuple: (columns, row_positions, records_total, records_filtered)
+            - columns: dicts shaped like load_table_columns' items, holding the page's rows
+            - row_positions: row_position of each row of the page
+            - records_total, records_filtered: number of rows before and after the search
+    """
+    if returns_table.storage == 'blob':
+        return _load_blob_row_window(returns_table, start, length, order_column_id, descending, search)
+
+    columns = sorted(returns_table.columns, key=lambda c: c.id)
+    if not columns:
+        return [], [], 0, 0
+    kinds = [(column.id, COLUMN_KINDS.get(column.discriminator, 'text')) for column in columns]
+    kind_by_column = dict(kinds)
+    base_table = BaseCell.__table__
+    first_column_id = columns[0].id
+
+    records_total = db.session.execute(
+        select(func.count()).select_from(base_table).where(base_table.c.column_id == first_column_id)
+    ).scalar()
+
+    matching = None
+    records_filtered = records_total
+    if search:
+        column_ids_by_kind = {}
+        for column_id, kind in kinds:
+            column_ids_by_kind.setdefault(kind, []).append(column_id)
+        matches = []
+        for kind, column_ids in column_ids_by_kind.items():
+            child_table = CELL_MODELS[kind].__table__
+            shown = child_table.c.value
+            if kind == 'date':
+                shown = func.substr(cast(shown, String), 1, 10)
+            elif kind == 'number':
+                shown = cast(shown, String)
+            matches.append(select(base_table.c.row_position)
+                           .join_from(base_table, child_table, base_table.c.id == child_table.c.id)
+                           .where(base_table.c.column_id.in_(column_ids))
+                           .where(func.lower(shown).contains(search.lower(), autoescape=True)))
+        matching = union(*matches).subquery()
+        records_filtered = db.session.execute(select(func.count()).select_from(matching)).scalar()
+
+    if order_column_id in kind_by_column:
+        child_table = CELL_MODELS[kind_by_column[order_column_id]].__table__
+        sort_value = child_table.c.value.desc() if descending else child_table.c.value.asc()
+        query = (select(base_table.c.row_position)
+                 .join_from(base_table, child_table, base_table.c.id == child_table.c.id)
+                 .where(base_table.c.column_id == order_column_id)
+                 .order_by(sort_value, base_table.c.row_position))
+    else:
+        query = (select(base_table.c.row_position)
+                 .where(base_table.c.column_id == first_column_id)
+                 .order_by(base_table.c.row_position))
+    if matching is not None:
+        query = query.where(base_table.c.row_position.in_(select(matching.c.row_position)))
+    if start:
+        query = query.offset(start)
+    if length is not None:
+        query = query.limit(length)
+    row_positions = db.session.execute(query).scalars().all()
+
+    aligned = load_cell_rows(kinds, positions=row_positions)
+    page = [
+        {'id': column.id, 'name': column.name, 'kind': kind, 'column': column, **aligned[column.id]}
+        for column, (_, kind) in zip(columns, kinds)
+    ]
+    return page, row_positions, records_total, records_filtered
+
+def _load_blob_row_window(returns_table, start, length, order_column_id, descending, search):
+    columns = load_table_columns(returns_table)
+    records_total = len(columns[0]['values']) if columns else 0
+    row_positions = range(records_total)
+    if search:
+        needle = search.lower()
+        row_positions = [position for position in row_positions
+                         if any(needle in format_cell_value(column['kind'], column['values'][position]).lower()
+                                for column in columns)]
+    records_filtered = len(row_positions)
+
+    order_column = next((column for column in columns if column['id'] == order_column_id), None)
+    if order_column is not None:
+        values = order_column['values']
+        # Missing values sort first, as NULLs do in SQLite; sorted() is stable, so ties keep the file order
+        row_positions = sorted(row_positions,
+                               key=lambda position: (values[position] is not None,
+                                                     values[position] if values[position] is not None else 0),
+                               reverse=descending)
+    row_positions = list(row_positions)[start:None if length is None else start + length]
+
+    page = []
+    for column in columns:
+        page.append({
+            **column,
+            'values': [column['values'][position] for position in row_positions],
+            'acd': [column['acd'][position] for position in row_positions] if column['acd'] is not None else None
+        })
+    return page, row_positions, records_total, records_filtered
+
+def count_table_articles(table_id):
+    """Return the number of Factiva articles linked to a ReturnsTable."""
+    return db.session.execute(select(func.count())
+                              .select_from(ReturnsTableArticle)
+                              .where(ReturnsTableArticle.returns_table_id == table_id)).scalar()
+
+def table_articles_statement(table_id, fields):
+    """Select the ARTICLE_FIELDS named by `fields` of the articles linked to a table, in link order."""
+    return (select(*(ARTICLE_FIELDS[field].label(field) for field in fields))
+            .select_from(FactivaArticle)
+            .join(ReturnsTableArticle, ReturnsTableArticle.article_id == FactivaArticle.id)
+            .where(ReturnsTableArticle.returns_table_id == table_id)
+            .order_by(ReturnsTableArticle.id))
+
+def load_table_articles(table_id, fields, offset=0, limit=None):
+    """Load some fields of the Factiva articles linked to a table, one page at a time.
+
+    Only the columns of `fields` are read, so listing headlines never loads article content.
+
+    Args:
+        table_id: ID of the ReturnsTable.
+        fields: Names from ARTICLE_FIELDS, e.g. ['headline', 'author'].
+        offset: Number of articles to skip, in the order they were linked to the table.
+        limit: Maximum number of articles, or None for all of them.
+
+    Returns:
+        list: One dict per article with the requested fields (publish_date as an ISO string).
+    """
+    statement = table_articles_statement(table_id, fields).offset(offset).limit(limit)
+    articles = [dict(row._mapping) for row in db.session.execute(statement)]
+    if 'publish_date' in fields:
+        for article in articles:
+            if article['publish_date']:
+                article['publish_date'] = article['publish_date'].isoformat()
+    return articles
+
+def load_article_frame(table_id, fields):
+    """Load some fields of all the articles linked to a table into a DataFrame, in link order."""
+    return pd.DataFrame(db.session.execute(table_articles_statement(table_id, fields)).all(),
+                        columns=list(fields))
@@ -0,0 +1,19 @@
+import io
+import os
+import sys
+import pandas as pd
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FACTIVA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads', 'factiva')
+
+def returns_workbook(start, periods, note='', return_columns=1):
+    """Return the bytes of an .xlsx returns file with daily dates, returns and a note column."""
+    frame = pd.DataFrame({'Date': pd.date_range(start, periods=periods, freq='D')})
+    for number in range(return_columns):
+        frame[f"Return {number + 1}" if number else 'Return'] = [(i + number) / 100 for i in range(periods)]
+    frame['Note'] = [note] * periods
+    buffer = io.BytesIO()
+    frame.to_excel(buffer, index=False)
+    return buffer.getvalue()
@@ -0,0 +1,63 @@
+"""Column types and values of chunked uploads, which must not depend on where the chunks split."""
+import io
+import pandas as pd
+import openpyxl
+import pytest
+
+@pytest.fixture
+def app(tmp_path):
+    from main import create_app
+    from table_cache import render_cache
+    render_cache.clear()
+    yield create_app(f"sqlite:///{tmp_path / 'returns.db'}")
+    render_cache.clear()
+
+def ingest_chunks(app, read_chunks, storage='cells'):
+    """Store an upload's DataFrame chunks as a new table and return its columns as /get_table_columns lists them."""
+    from models import db, ReturnsTable
+    from ingest import ingest_dataframe_chunks
+    with app.app_context():
+        returns_table = ReturnsTable(name='chunks', storage=storage)
+        db.session.add(returns_table)
+        db.session.flush()
+        ingest_dataframe_chunks(db, returns_table, read_chunks)
+        db.session.commit()
+        table_id = returns_table.id
+    return app.test_client().get(f'/get_table_columns/{table_id}').json['columns']
+
+@pytest.mark.parametrize('storage', ['cells', 'blob'])
+def test_excel_column_blank_in_first_chunk(app, storage):
+    from ingest import iter_excel_chunks
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['Price', 'Ticker', 'Return'])
+    for row in range(8):
+        # Price and Ticker are empty for the whole first chunk of 3 rows
+        sheet.append([row * 1.5 if row >= 3 else None, 'AAA' if row >= 3 else None, row / 100])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+
+    columns = ingest_chunks(app, lambda text_positions: iter_excel_chunks(
+        buffer, chunksize=3, text_positions=text_positions), storage)
+    assert [column['kind'] for column in columns] == ['number', 'text', 'number']
+    assert columns[0]['values'][:4] == [None, None, None, 4.5]
+    assert columns[0]['values'][-1] == 10.5
+    assert columns[1]['values'] == ['N/A'] * 3 + ['AAA'] * 5
+
+CSV_WITH_LATE_TEXT = "Date,Price,Note\n" + "".join(
+    f"2014-01-{day:02d},{price},n{day}\n"
+    for day, price in enumerate(["1.0", "1.50", "1e3", "", "2", "0.10", "x", "3.25"], start=1))
+
+@pytest.mark.parametrize('storage', ['cells', 'blob'])
+def test_widened_csv_column_keeps_file_text_at_any_chunk_size(app, storage):
+    def read_csv_chunks(chunksize):
+        def read_chunks(text_positions):
+            return pd.read_csv(io.StringIO(CSV_WITH_LATE_TEXT), chunksize=chunksize,
+                               dtype=dict.fromkeys(text_positions, str))
+        return read_chunks
+
+    for chunksize in (1, 3, 6, 100):
+        columns = ingest_chunks(app, read_csv_chunks(chunksize), storage)
+        assert [column['kind'] for column in columns] == ['text', 'text', 'text'], chunksize
+        assert columns[1]['values'] == ["1.0", "1.50", "1e3", "N/A", "2", "0.10", "x", "3.25"], chunksize
@@ -0,0 +1,49 @@
+"""Query counts of the table routes, so an N+1 pattern can't come back unnoticed.
+
+Uses the statement capture of explain_queries.py: each route must stay within its
+QUERY_BUDGETS entry and issue as many queries for a wide table as for a narrow one.
+"""
+import io
+import pytest
+from werkzeug.datastructures import FileStorage
+from conftest import returns_workbook
+from explain_queries import QUERY_BUDGETS, capture_route_statements
+
+ROUTES = ('get_table', 'get_table_columns')
+
+@pytest.fixture
+def app(tmp_path):
+    from main import create_app
+    from table_cache import render_cache
+    # Rendered payloads are cached by table id, which a fresh database reuses
+    render_cache.clear()
+    yield create_app(f"sqlite:///{tmp_path / 'returns.db'}")
+    render_cache.clear()
+
+def upload_table(app, name, periods, return_columns, storage):
+    from models import db
+    from utils import extract_data_file
+    workbook = returns_workbook('2014-01-01', periods, note=name, return_columns=return_columns)
+    with app.app_context():
+        returns_table, _ = extract_data_file(FileStorage(stream=io.BytesIO(workbook), filename=name),
+                                             db, storage=storage)
+        db.session.commit()
+        return returns_table.id
+
+def route_query_counts(app, table_id):
+    requests = [("get_table", "GET", f"/get_table/{table_id}", None),
+                ("get_table_columns", "GET", f"/get_table_columns/{table_id}", None)]
+    _, query_counts = capture_route_statements(app, requests)
+    return query_counts
+
+@pytest.mark.parametrize('storage', ['cells', 'blob'])
+def test_table_routes_query_count_does_not_grow_with_columns(app, storage):
+    narrow_id = upload_table(app, 'narrow.xlsx', periods=20, return_columns=1, storage=storage)
+    wide_id = upload_table(app, 'wide.xlsx', periods=300, return_columns=12, storage=storage)
+
+    narrow = route_query_counts(app, narrow_id)
+    wide = route_query_counts(app, wide_id)
+
+    for route in ROUTES:
+        assert wide[route] <= QUERY_BUDGETS[route], f"{route}: {wide[route]} queries"
+        assert wide[route] == narrow[route], f"{route}: {narrow[route]} queries for 3 columns, {wide[route]} for 14"
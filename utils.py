@@ -1,116 +1,289 @@
+from datetime import datetime
 import pandas as pd
-from models import db, ReturnsTable, Column, DateColumn, TextColumn, NumberCell, DateCell, TextCell
+from models import ReturnsTable
+from table_store import load_table_columns, load_row_range, load_date_range, format_cell_value
+from ingest import (ingest_dataframe_chunks, fingerprint_upload, find_table_by_hash,
+                    count_table_rows, clone_returns_table, iter_excel_chunks, CSV_CHUNK_SIZE)
 
-def extract_data_file(file, database) -> tuple[ReturnsTable, pd.DataFrame]:
+# Strings read as missing values in uploaded files
+NA_VALUES = ['NA', 'N/A', 'na', 'n/a']
+
+# Encodings of date values accepted by convert_ReturnsTable_to_columns
+DATE_FORMATS = ('iso', 'epoch_days')
+
+EPOCH = datetime(1970, 1, 1)
+
+# Rows read and rendered at a time by iter_ReturnsTable_html
+RENDER_BATCH_ROWS = 5000
+
+# Article fields merge_factiva_data can add to a table as text columns
+MERGE_FIELDS = ('headline', 'author', 'word_count', 'publish_date', 'source', 'content_preview')
+
+def extract_data_file(file, database, storage='cells', chunksize=CSV_CHUNK_SIZE, progress=None) -> tuple[ReturnsTable, int]:
     """Extract file data and store it in the database.
 
-    This function takes an uploaded file (CSV or Excel), reads it into a pandas DataFrame,
+    This function takes an uploaded file (CSV or Excel), reads it with pandas,
     creates the corresponding ReturnsTable and Column models, and stores the data.
     It automatically detects and converts column types (date, numeric, and text).
+    Cell values are written a whole column at a time through ingest.insert_column_cells,
+    and the ingestion rate is printed in rows/sec.
 
-    If a table with the same filename already exists, it will be deleted.
+    CSV files are streamed in chunks of `chunksize` rows and .xlsx/.xlsm workbooks are
+    streamed from the sheet in read-only mode: column types are inferred from a sample
+    of the first chunk and each chunk is written before the next one is read, so memory
+    use does not grow with the size of the file.
 
     Args:
         file: Uploaded file object (CSV or Excel format).
         database: Database instance to use for storing the data.
+        storage: Storage backend for the new table: 'cells' (one row per value) or
+            'blob' (one compressed array per column, see table_store).
+        chunksize: Number of CSV rows read and written at a time.
+        progress: Optional callable receiving the number of rows stored so far.
 
     Returns:
-        tuple: (ReturnsTable, pandas.DataFrame)
+        tuple: (ReturnsTable, int)
             - ReturnsTable: Database model instance representing the processed data.
-            - DataFrame: pandas DataFrame containing the file contents.
+            - int: Number of data rows stored.
 
     Raises:
-        ValueError: If a column type is not supported (only numeric, datetime, or text).
-        Exception: If any other error occurs during file reading or data processing.
+        Exception: If any error occurs during file reading or data processing.
     """
     try:
         filename = file.filename
-        
-        # Read the file into a DataFrame
-        if filename.endswith('.csv'):
-            df = pd.read_csv(file, na_values=['NA','N/A','na','n/a'])
-        else:
-            df = pd.read_excel(file, na_values=['NA','N/A','na','n/a'])
+
+        # Skip parsing entirely when these exact bytes were ingested before: the table is
+        # reused while it is still as uploaded (version 1), otherwise its uploaded columns are copied.
+        # Only tables in the requested storage backend count; other backends are parsed afresh
+        content_hash = fingerprint_upload(file)
+        existing_table = find_table_by_hash(content_hash, filename, storage)
+        if existing_table is not None:
+            if existing_table.name == filename and existing_table.version == 1:
+                print(f"Upload matches existing table {existing_table.id} ({filename}); reusing it")
+                return existing_table, count_table_rows(existing_table)
+            returns_table = clone_returns_table(database, existing_table, filename)
+            return returns_table, count_table_rows(returns_table)
+
+        # Read the file lazily; CSVs and .xlsx/.xlsm sheets are streamed in chunks,
+        # legacy .xls workbooks are read whole. Columns widened to text are read again
+        # from the start without type conversion, so they keep the text of the file
+        def read_chunks(text_positions):
+            file.stream.seek(0)
+            if filename.endswith('.csv'):
+                return pd.read_csv(file, na_values=NA_VALUES, chunksize=chunksize,
+                                   dtype=dict.fromkeys(text_positions, str))
+            if filename.endswith('.xlsx') or filename.endswith('.xlsm'):
+                return iter_excel_chunks(file, na_values=NA_VALUES, text_positions=text_positions)
+            return [pd.read_excel(file, na_values=NA_VALUES, dtype=dict.fromkeys(text_positions, object))]
 
         # Create a new ReturnsTable instance
-        returns_table = ReturnsTable(name=filename)
+        returns_table = ReturnsTable(name=filename, content_hash=content_hash, storage=storage)
         database.session.add(returns_table)
         database.session.flush()
 
-        # Process columns
-        for column_name in df.columns:
-            column_data = df[column_name]
-            
-            # Date columns
-            if pd.api.types.is_datetime64_any_dtype(column_data) or isinstance(column_data.iloc[0], pd.Timestamp):
-                column = DateColumn(name=column_name, returns_table_id=returns_table.id)
-                database.session.add(column)
-                database.session.flush()
-                cells = []
-                for value in column_data:
-                    cell = DateCell(value=pd.to_datetime(value), column_id=column.id)
-                    cells.append(cell)
-            # Numeric columns
-            elif pd.api.types.is_numeric_dtype(column_data) and not isinstance(column_data.iloc[0], pd.Timestamp):
-                column = Column(name=column_name, returns_table_id=returns_table.id)
-                database.session.add(column)
-                database.session.flush()
-                cells = []
-                for value in column_data:
-                    cell = NumberCell(value=float(value) if pd.notnull(value) else None, column_id=column.id)
-                    cells.append(cell)
-            # Text columns 
-            else:
-                column = TextColumn(name=column_name, returns_table_id=returns_table.id)
-                database.session.add(column)
-                database.session.flush()
-                cells = []
-                for value in column_data:
-                    if pd.isna(value):
-                        cell = TextCell(value="N/A", column_id=column.id)
-                    else:
-                        cell = TextCell(value=str(value), column_id=column.id)
-                    cells.append(cell)
-            
-            database.session.bulk_save_objects(cells)
-                
+        row_count = ingest_dataframe_chunks(database, returns_table, read_chunks, progress=progress)
 
         # Don't commit here, let the caller handle the commit
         database.session.flush()
-        return returns_table, df
+        return returns_table, row_count
 
     except Exception as e:
         print(f"Error in extract_data_file: {str(e)}")
         raise
 
 def convert_ReturnsTable_to_html(returns_table):
+    """Render a whole returns table as one HTML string; see iter_ReturnsTable_html."""
+    return "".join(iter_ReturnsTable_html(returns_table))
+
+def iter_ReturnsTable_html(returns_table, batch_rows=RENDER_BATCH_ROWS):
+    """Render a returns table as HTML, yielding it in chunks of at most `batch_rows` rows.
+
+    The header is yielded before any cell is read. Cell tables are then read one
+    row range at a time, so memory use depends on `batch_rows`, not on the table size;
+    blob tables decode each column once and slice it.
+
+    Yields:
+        str: The opening tags and header, one chunk of <tr> rows per batch, then the closing tags.
+    """
+    columns = sorted(returns_table.columns, key=lambda c: c.id)
     # Include the table name in a data attribute on the table tag
-    html = f"<table id='returnsTable' class='display' data-table-name='{returns_table.name}'>"
+    yield (f"<table id='returnsTable' class='display' data-table-name='{returns_table.name}'>"
+           "<thead><tr>" + "".join(f"<th>{col.name}</th>" for col in columns) + "</tr></thead><tbody>")
+
+    if columns:
+        if returns_table.storage == 'blob':
+            loaded = load_table_columns(returns_table)
+            num_rows = len(loaded[0]['values']) if loaded else 0
+            for start in range(0, num_rows, batch_rows):
+                yield render_rows_html(loaded, start, min(start + batch_rows, num_rows))
+        else:
+            start = 0
+            while True:
+                batch = load_row_range(returns_table, start, start + batch_rows)
+                num_rows = len(batch[0]['values'])
+                if num_rows:
+                    yield render_rows_html(batch, 0, num_rows, row_offset=start)
+                if num_rows < batch_rows:
+                    break
+                start += batch_rows
+    yield "</tbody></table>"
+
+def render_rows_html(columns, start, stop, row_offset=0):
+    """Render rows [start, stop) of loaded column dicts as <tr> elements.
+
+    Args:
+        columns: Column dicts as returned by load_table_columns / load_row_range.
+        start, stop: Range of indexes into the columns' value lists to render.
+        row_offset: Table row number of index 0 of the value lists (for load_row_range batches).
+    """
+    rows = []
+    for i in range(start, stop):
+        has_acd = False
+        row_cells = []
+        for col in columns:
+            value = col['values'][i]
+            if col['kind'] == "date":
+                acd = col['acd'][i]
+                if acd == 1:
+                    has_acd = True
+                # Cell-backed tables address a date cell by id, blob tables by column and row
+                if col['cell_ids'] is not None:
+                    cell_ref = f"data-cell-id='{col['cell_ids'][i]}'"
+                else:
+                    cell_ref = f"data-column-id='{col['id']}' data-row='{row_offset + i}'"
+                row_cells.append(
+                    f"<td data-cell-type='date' {cell_ref} data-acd='{acd}'>"
+                    f"{format_cell_value('date', value)}"
+                    "</td>"
+                )
+            else:
+                row_cells.append(f"<td>{format_cell_value(col['kind'], value)}</td>")
+        row_class = " class='acd-row'" if has_acd else ""
+        rows.append(f"<tr{row_class}>" + "".join(row_cells) + "</tr>")
+    return "".join(rows)
+
+def convert_ReturnsTable_to_html_shell(returns_table):
+    """Render a returns table's header only, for DataTables to fill page by page.
+
+    The table carries its id, version and the range of its date column as data attributes;
+    the rows themselves are fetched from /get_table_rows (see convert_rows_to_datatables).
+    """
+    columns = sorted(returns_table.columns, key=lambda c: c.id)
+    first_date, last_date = load_date_range(returns_table)
+    attributes = (f" data-table-name='{returns_table.name}' data-table-id='{returns_table.id}'"
+                  f" data-version='{returns_table.version}' data-server-side='true'")
+    if first_date and last_date:
+        attributes += f" data-first-date='{first_date.strftime('%Y-%m-%d')}' data-last-date='{last_date.strftime('%Y-%m-%d')}'"
+    html = f"<table id='returnsTable' class='display'{attributes}>"
     html += "<thead><tr>"
-    for col in returns_table.columns:
+    for col in columns:
         html += f"<th>{col.name}</th>"
-    html += "</tr></thead><tbody>"
-    
-    if returns_table.columns:
-        num_rows = len(returns_table.columns[0].cells)
-        for i in range(num_rows):
-            has_acd = False
-            row_cells = []
-            for col in returns_table.columns:
-                cell = col.cells[i]
-                if cell.discriminator == "date_cell":
-                    if cell.acd == 1:
-                        has_acd = True
-                    cell_html = (
-                        f"<td data-cell-type='date' data-cell-id='{cell.id}' data-acd='{cell.acd}'>"
-                        f"{cell.value.strftime('%Y-%m-%d') if cell.value else ''}"
-                        "</td>"
-                    )
-                else:
-                    cell_html = f"<td>{cell.value}</td>"
-                row_cells.append(cell_html)
-            row_class = " class='acd-row'" if has_acd else ""
-            html += f"<tr{row_class}>" + "".join(row_cells) + "</tr>"
-    html += "</tbody></table>"
+    html += "</tr></thead><tbody></tbody></table>"
     return html
 
+def convert_rows_to_datatables(columns, row_positions):
+    """Shape one page of rows (see table_store.load_row_window) as DataTables row objects.
+
+    Each row maps the column index (as a string) to the cell's displayed text, like the
+    cells of convert_ReturnsTable_to_html. Date cells also get the attributes the ACD popup
+    reads under 'date_cells', and rows with an ACD date get the 'acd-row' class.
+    """
+    rows = []
+    for i, position in enumerate(row_positions):
+        row = {}
+        date_cells = {}
+        has_acd = False
+        for index, col in enumerate(columns):
+            row[str(index)] = format_cell_value(col['kind'], col['values'][i])
+            if col['kind'] == "date":
+                acd = col['acd'][i]
+                if acd == 1:
+                    has_acd = True
+                attributes = {'data-cell-type': 'date', 'data-acd': acd}
+                # Cell-backed tables address a date cell by id, blob tables by column and row
+                if col['cell_ids'] is not None:
+                    attributes['data-cell-id'] = col['cell_ids'][i]
+                else:
+                    attributes['data-column-id'] = col['id']
+                    attributes['data-row'] = position
+                date_cells[str(index)] = attributes
+        if date_cells:
+            row['date_cells'] = date_cells
+        if has_acd:
+            row['DT_RowClass'] = 'acd-row'
+        rows.append(row)
+    return rows
+
+def convert_ReturnsTable_to_columns(returns_table, column_ids=None, date_format='iso'):
+    """Build a compact, column-oriented JSON payload for a returns table.
+
+    Each column's values are sent as one typed array instead of rendered HTML cells:
+    numbers as JSON numbers, text as strings and dates either as 'YYYY-MM-DD' strings
+    ('iso') or as whole days since 1970-01-01 ('epoch_days'). Missing values are null.
+    Date columns also carry their ACD flags as a string with one '0'/'1' per row.
+
+    Args:
+        returns_table: ReturnsTable to convert.
+        column_ids: Optional list of column ids to include; None includes every column.
+        date_format: One of DATE_FORMATS.
+
+    Returns:
+        dict: {'table_id', 'name', 'version', 'row_count',
+               'columns': [{'id', 'name', 'kind', 'values', 'acd'?}]}
+    """
+    columns = load_table_columns(returns_table, column_ids=column_ids)
+    payload_columns = []
+    for col in columns:
+        values = col['values']
+        if col['kind'] == 'date':
+            if date_format == 'epoch_days':
+                values = [(value - EPOCH).days if value else None for value in values]
+            else:
+                values = [value.strftime('%Y-%m-%d') if value else None for value in values]
+        payload_column = {'id': col['id'], 'name': col['name'], 'kind': col['kind'], 'values': values}
+        if col['acd'] is not None:
+            payload_column['acd'] = ''.join('1' if acd == 1 else '0' for acd in col['acd'])
+        payload_columns.append(payload_column)
+
+    return {
+        'table_id': returns_table.id,
+        'name': returns_table.name,
+        'version': returns_table.version,
+        'row_count': len(payload_columns[0]['values']) if payload_columns else 0,
+        'columns': payload_columns
+    }
+
+def merge_articles_by_date(date_values, articles, fields):
+    """Left-join a table's dates with the articles published on the same day, a whole column at a time.
+
+    Each row takes the first article (in `articles` order) published on its date, ignoring
+    the time of day; rows without a date or without an article get "".
+
+    Args:
+        date_values: Values of the table's date column, in row order.
+        articles: DataFrame with publish_date and each of `fields` (see load_article_frame).
+        fields: Names from MERGE_FIELDS.
+
+    Returns:
+        tuple: (columns, matches) - field -> list of text values in row order, and the
+            number of rows matched to an article.
+    """
+    days = pd.to_datetime(pd.Series(date_values, dtype=object)).dt.normalize()
+    first_articles = (articles
+                      .assign(day=pd.to_datetime(articles['publish_date']).dt.normalize())
+                      .dropna(subset=['day'])
+                      .drop_duplicates('day'))
+    # A left merge on unique days keeps one row per table row, in table order
+    merged = pd.DataFrame({'day': days}).merge(first_articles, on='day', how='left', indicator=True)
+    matched = merged['_merge'] == 'both'
+
+    columns = {}
+    for field in fields:
+        values = merged[field]
+        if field == 'word_count':
+            counts = pd.to_numeric(values).astype('Int64')
+            values = counts.astype(str).where(counts.fillna(0).ne(0), "")
+        elif field == 'publish_date':
+            values = pd.to_datetime(values).dt.strftime('%Y-%m-%d')
+        columns[field] = values.where(matched, "").tolist()
+    return columns, int(matched.sum())